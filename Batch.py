@@ -0,0 +1,181 @@
+import numpy as np
+import xarray as xr
+import argparse
+import glob
+import os
+import multiprocessing
+import time as clock
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import Engine
+import Environment
+import Geometry
+import Input
+import Pixel
+import Simulator
+import Sweep
+
+def discover(folder, pattern='*.csv') -> list:
+    """
+    Find the run files of a batch.
+
+    Args:
+        folder (str): Folder holding the run files.
+        pattern (str): Glob pattern of the run files within the folder.
+
+    Returns:
+        list: Paths to the run files, sorted by name.
+    """
+    return sorted(path for path in glob.glob(os.path.join(os.path.expanduser(folder), pattern)) if os.path.isfile(path))
+
+def simulate_file(path, simulator, seed=None, noise=True, block_size=Input.BLOCK_SIZE):
+    """
+    Simulate one run file (runs in a worker process).
+
+    A single tile is streamed block by block, so a worker only holds one block of its file at a
+    time. Several tiles are simulated chunk by chunk in the worker's own threads, from the file
+    memory-mapped through the binary cache.
+
+    Args:
+        path (str): Path to the CSV file.
+        simulator (Simulator.Simulator): Configuration of the simulation.
+        seed (int or list): Seed of the noise of this run.
+        noise (bool): Apply seeded Gaussian and leakage noise to the input.
+        block_size (int): Number of time stamps read at once.
+
+    Returns:
+        tuple: The Output object of the run and the time in seconds it took.
+    """
+    start = clock.perf_counter()
+    simulator.processes = 1
+    simulator.envir = Environment.Noise(seed=seed, per_pixel=True) if noise else None
+    if simulator.geometry.tiles == 1:
+        output = simulator.run_file(path, block_size)
+    else:
+        output = simulator.run_chunked(path, block_size, threads=1)
+    return output, clock.perf_counter() - start
+
+def report_progress(done, total, path, seconds, error) -> None:
+    """
+    Print the progress of a batch, one line per finished run.
+
+    Args:
+        done (int): Number of runs finished so far.
+        total (int): Number of runs of the batch.
+        path (str): Path to the run file that just finished.
+        seconds (float): Time the run took, None if it failed.
+        error (str): Error message of a failed run, None otherwise.
+    """
+    status = "failed: " + error if error else "done in {:.1f} s".format(seconds)
+    print("[{}/{}] {} {}".format(done, total, os.path.basename(path), status))
+
+def batch(paths, simulator=None, seed=None, noise=True, block_size=Input.BLOCK_SIZE, processes=None, max_tasks_per_child=None,
+          frames=True, progress=report_progress) -> xr.Dataset:
+    """
+    Simulate many run files in parallel and combine them into one dataset with a 'run' dimension.
+
+    A file that cannot be read or simulated does not stop the batch: its statistics are NaN
+    and its error message is kept in the 'error' variable.
+
+    Args:
+        paths (list): Paths to the run files, eg from discover.
+        simulator (Simulator.Simulator): Configuration of the simulation (its processes are ignored), the defaults by default.
+        seed (int): Seed of the batch, run i uses the noise seed [seed, i]. None draws fresh noise for every run.
+        noise (bool): Apply seeded Gaussian and leakage noise to the input.
+        block_size (int): Number of time stamps a worker reads at once.
+        processes (int): Number of worker processes, the number of CPUs by default.
+        max_tasks_per_child (int): Replace a worker process after this many files to return its memory, None keeps them.
+        frames (bool): Also keep the instantaneous current frames of every run (padded with NaN to the longest run).
+            The dense frames of every run are built in this process and held together, (runs, frames, pixels)
+            floats however the runs were streamed, so turn it off for long or many runs.
+        progress (callable): Called as progress(done, total, path, seconds, error) after every run, None is silent.
+
+    Returns:
+        xr.Dataset: One variable per statistic in Sweep.STATISTICS, the 'error' and 'seconds' of every run
+            and, with frames, the 'current' frames, all along the 'run' dimension.
+    """
+    simulator = Simulator.Simulator() if simulator is None else simulator
+    names = [os.path.basename(path) for path in paths]
+    outputs = [None] * len(paths)
+    errors = [''] * len(paths)
+    seconds = np.full(len(paths), np.nan)
+
+    # Recycling workers requires fresh processes rather than forks of this one
+    context = multiprocessing.get_context('spawn') if max_tasks_per_child else None
+    with ProcessPoolExecutor(processes, mp_context=context, max_tasks_per_child=max_tasks_per_child) as pool:
+        futures = {pool.submit(simulate_file, path, simulator, None if seed is None else [seed, i], noise, block_size): i
+                   for i, path in enumerate(paths)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                outputs[i], seconds[i] = future.result()
+            except Exception as error:
+                errors[i] = type(error).__name__ + ": " + str(error)
+            if progress is not None:
+                progress(done, len(paths), paths[i], None if errors[i] else seconds[i], errors[i] or None)
+
+    # Summary statistics of every run, NaN for the failed ones
+    summaries = [Sweep.summarize(output) if output is not None else dict.fromkeys(Sweep.STATISTICS, np.nan) for output in outputs]
+    data_vars = {stat: ('run', np.array([summary[stat] for summary in summaries], dtype=float)) for stat in Sweep.STATISTICS}
+    data_vars['error'] = ('run', np.array(errors, dtype=str))
+    data_vars['seconds'] = ('run', seconds)
+    dataset = xr.Dataset(data_vars, coords={'run': names})
+
+    if frames:
+        # Runs are aligned on their frame time stamps, shorter (or failed) runs are padded with NaN
+        arrays = [output.arr.expand_dims(run=[name]) for name, output in zip(names, outputs) if output is not None]
+        if arrays:
+            dataset['current'] = xr.concat(arrays, dim='run', join='outer').reindex(run=names)
+    return dataset
+
+def parse_args(argv=None):
+    """
+    Parse the command line of a batch.
+
+    Args:
+        argv (list): Command line arguments, sys.argv by default.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Simulate a folder of run files in parallel into one dataset with a 'run' dimension.")
+    parser.add_argument('--input-dir', default='.', help="folder holding the run files")
+    parser.add_argument('--pattern', default='*.csv', help="glob pattern of the run files")
+    parser.add_argument('--output', default='batch.h5', help="HDF5 file to write the combined dataset to")
+    parser.add_argument('--clock-freq', type=int, default=Pixel.CLOCK_FREQ, help="clock period in nanoseconds")
+    parser.add_argument('--x-dim', type=int, default=8, help="number of rows of pixels per tile")
+    parser.add_argument('--y-dim', type=int, default=8, help="number of columns of pixels per tile")
+    parser.add_argument('--tiles', type=int, default=1, help="number of tiles of the detector")
+    parser.add_argument('--engine', default='ticks', choices=Engine.ENGINES, help="simulation engine")
+    parser.add_argument('--units', type=int, help="account charge as integer counts of 1/UNITS electron")
+    parser.add_argument('--drift-length', type=float, help="drift the charge over DRIFT_LENGTH cm with electron life time and transverse diffusion")
+    parser.add_argument('--processes', type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--max-tasks-per-child', type=int, help="replace a worker process after this many files")
+    parser.add_argument('--block-size', type=int, default=Input.BLOCK_SIZE, help="number of time stamps a worker reads at once")
+    parser.add_argument('--seed', type=int, help="seed of the noise of the batch")
+    parser.add_argument('--no-noise', action='store_true', help="simulate the input without noise")
+    parser.add_argument('--no-frames', action='store_true', help="only keep the summary statistics of every run (the frames of all the runs are held in memory at once)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """
+    Run a batch from the command line and save the combined dataset.
+
+    Args:
+        argv (list): Command line arguments, sys.argv by default.
+    """
+    args = parse_args(argv)
+    paths = discover(args.input_dir, args.pattern)
+    if not paths:
+        raise Exception("No file matches " + os.path.join(args.input_dir, args.pattern) + ".")
+
+    geometry = Geometry.Geometry(args.x_dim, args.y_dim, args.tiles)
+    transport = None if args.drift_length is None else Environment.Transport(args.drift_length)
+    simulator = Simulator.Simulator(geometry, args.clock_freq, args.engine, units=args.units, transport=transport)
+    dataset = batch(paths, simulator, args.seed, not args.no_noise, args.block_size, args.processes, args.max_tasks_per_child, not args.no_frames)
+
+    dataset.to_netcdf(args.output, engine='h5netcdf')
+    failed = int((dataset['error'] != '').sum())
+    print(f"{len(paths) - failed} of {len(paths)} runs succeeded, dataset saved to: {args.output}")
+
+if __name__ == '__main__':
+    main()
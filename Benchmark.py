@@ -0,0 +1,298 @@
+import numpy as np
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time as clock
+import tracemalloc
+import Engine
+import Environment
+import Geometry
+import Input
+import Output
+import Pixel
+import Synthetic
+import Tile
+
+def feed(blocks, waited):
+    """
+    Pass blocks through, adding the time spent producing them to waited, so a stage is timed without its input.
+
+    Args:
+        blocks (iterable): Blocks of input of the stage.
+        waited (list): One-element list the seconds spent waiting for the blocks are added to.
+
+    Yields:
+        The blocks, one at a time.
+    """
+    iterator = iter(blocks)
+    while True:
+        start = clock.perf_counter()
+        block = next(iterator, None)
+        waited[0] += clock.perf_counter() - start
+        if block is None:
+            return
+        yield block
+
+def peak_traced_mb(function) -> float:
+    """
+    Run a stage under tracemalloc and get the peak of the memory it allocated.
+
+    Args:
+        function (callable): Function running the stage, called with a throwaway waited list (see feed).
+
+    Returns:
+        float: Peak of the traced allocations (NumPy arrays included) in MiB.
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        function([0.0])
+        return (tracemalloc.get_traced_memory()[1] - baseline) / 2**20
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+
+def measure(results, stage, function, steps, pixels, memory=True):
+    """
+    Time one stage of the simulation, record its throughput and the peak memory of the stage alone.
+
+    Tracing allocations slows Python code down several times, so the stage is timed untraced and
+    then run a second time under tracemalloc for its memory.
+
+    Args:
+        results (list): List the measurement is appended to.
+        stage (str): Name of the stage.
+        function (callable): Function running the stage from scratch, called with a waited list that
+            feed fills with the time spent producing the input of the stage, which is not counted.
+        steps (int): Number of time steps (or frames, for the output stages) the stage processes.
+        pixels (int): Number of pixels per time step.
+        memory (bool): Also measure the peak memory of the stage.
+
+    Returns:
+        The value returned by function.
+    """
+    waited = [0.0]
+    start = clock.perf_counter()
+    value = function(waited)
+    seconds = clock.perf_counter() - start - waited[0]
+    results.append({
+        'stage': stage,
+        'seconds': seconds,
+        'steps': steps,
+        'steps_per_s': steps / seconds if seconds else None,
+        'pixel_updates_per_s': steps * pixels / seconds if seconds else None,
+        'peak_traced_mb': peak_traced_mb(function) if memory else None,
+    })
+    print("{:<36} {:>10.3f} s {:>14.0f} steps/s {:>16.0f} pixel-updates/s {:>10.1f} MiB".format(
+        stage, seconds, results[-1]['steps_per_s'] or 0, results[-1]['pixel_updates_per_s'] or 0, results[-1]['peak_traced_mb'] or 0))
+    return value
+
+def count_steps(blocks) -> int:
+    """
+    Run through a sequence of blocks.
+
+    Args:
+        blocks (iterable): 2D arrays or xarrays with time along their first dimension.
+
+    Returns:
+        int: Number of time steps of all the blocks.
+    """
+    return sum(len(block) for block in blocks)
+
+def replenish_loop(tile, blocks, steps) -> int:
+    """
+    Call Tile.replenish once per time step.
+
+    Args:
+        tile (Tile): The Tile object representing a grid of pixels.
+        blocks (iterable): 3D xarrays (time, x, y) of consecutive blocks of charge values.
+        steps (int): Maximum number of time steps to replenish.
+
+    Returns:
+        int: Number of time steps replenished.
+    """
+    done = 0
+    for block in blocks:
+        data = np.asarray(block.values[:steps - done])
+        times = np.asarray(block[block.dims[0]].values[:steps - done], dtype=float)
+        for t in range(len(times)):
+            tile.replenish(data[t], times[t])
+        done += len(times)
+        if done >= steps:
+            break
+    return done
+
+def frame_blocks(output, block_size):
+    """
+    Build the dense frames of an Output a block of frames at a time.
+
+    Args:
+        output (Output): The Output object holding the reset events.
+        block_size (int): Maximum number of frames per block.
+
+    Yields:
+        tuple: Index of the first frame of the block and the 3D array (frame, x, y) of its frames.
+    """
+    for first in range(0, len(output.time), block_size):
+        last = first + block_size
+        yield first, output.to_xarray(output.time[first], output.time[last] if last < len(output.time) else None).values
+
+def set_frame_loop(output, blocks) -> None:
+    """
+    Call Output.set_frame once per frame.
+
+    Args:
+        output (Output): The Output object to store the frames in.
+        blocks (iterable): Index of the first frame and 3D array (frame, x, y) of instantaneous currents of every block, see frame_blocks.
+    """
+    for first, frames in blocks:
+        for t in range(len(frames)):
+            output.set_frame(first + t, frames[t])
+
+def run(time_steps=100000, x_dim=8, y_dim=8, engines=('ticks', 'events'), replenish_steps=100000, csv=True,
+        background=Synthetic.BACKGROUND_CHARGE, signal_rate=Synthetic.SIGNAL_RATE, signal_charge=Synthetic.SIGNAL_CHARGE,
+        seed=0, clock_freq=Pixel.CLOCK_FREQ, folder=None, block_size=Input.BLOCK_SIZE, memory=True) -> dict:
+    """
+    Benchmark every stage of a simulation on synthetic input.
+
+    The input is streamed block by block through every stage, the way long recordings are
+    simulated, so the memory of the benchmark depends on the block size and not on time_steps.
+    Each stage is timed without the stages producing its input, and its memory is the peak traced
+    while it runs on its own (see measure).
+
+    Args:
+        time_steps (int): Number of time stamps of the synthetic input.
+        x_dim (int): Number of rows of pixels in the tile.
+        y_dim (int): Number of columns of pixels in the tile.
+        engines (tuple): Engines of Engine.ENGINES to benchmark ('step' is slow on long inputs).
+        replenish_steps (int): Number of time steps of the Tile.replenish benchmark.
+        csv (bool): Write the input to a CSV file and benchmark parsing it, otherwise generate it in memory.
+        background (float): Mean background charge per pixel per nanosecond in coulombs.
+        signal_rate (float): Probability of a signal hit per pixel per nanosecond.
+        signal_charge (float): Mean charge of a signal hit in coulombs.
+        seed (int): Seed of the synthetic input and of the noise.
+        clock_freq (int): Clock period in nanoseconds.
+        folder (str): Folder for the temporary files, a new temporary folder by default.
+        block_size (int): Number of time stamps (or frames, for the output stages) per block.
+        memory (bool): Also measure the peak memory of every stage, which runs every stage a second time.
+
+    Returns:
+        dict: The configuration and the measurement of every stage.
+    """
+    geometry = Geometry.Geometry(x_dim, y_dim)
+    pixels = geometry.pixels
+    synthetic = dict(background=background, signal_rate=signal_rate, signal_charge=signal_charge, seed=seed)
+    results = []
+
+    with tempfile.TemporaryDirectory(dir=folder) as scratch:
+        # Every stage reads the input anew, block by block
+        if csv:
+            path = Synthetic.write_csv(os.path.join(scratch, 'synthetic.csv'), time_steps, pixels, block_size=block_size, **synthetic)
+            source = lambda: Input.read_blocks(path, block_size)
+        else:
+            source = lambda: Synthetic.generate_blocks(time_steps, pixels, block_size=block_size, **synthetic)
+
+        # The 3D blocks of a stage, with the same noise in every stage
+        def blocks(waited=None):
+            raw = source() if waited is None else feed(source(), waited)
+            return Input.three_d_blocks(raw, Environment.Noise(seed=seed, per_pixel=True), geometry)
+
+        # One run of an engine over the streamed input
+        def simulate(engine, waited):
+            output = Output.Output([], geometry)
+            Engine.iterate_blocks(Tile.Tile(x_dim, y_dim, clock_freq), feed(blocks(), waited), output, engine)
+            return output
+
+        # Every frame of an output set again, a block of frames at a time
+        def replay(output, waited):
+            frames = Output.Output(output.time, geometry)
+            set_frame_loop(frames, feed(frame_blocks(output, block_size), waited))
+            return frames
+
+        # The dense frames are built anew by every save, as in a run that saves once
+        def save(frames, waited):
+            frames.dense = None
+            frames.save_xarray_to_hdf5('benchmark.h5', scratch)
+
+        # Input stages
+        if csv:
+            measure(results, 'Input.read_blocks', lambda waited: count_steps(source()), time_steps, pixels, memory)
+        measure(results, 'Input.three_d_array', lambda waited: count_steps(blocks(waited)), time_steps, pixels, memory)
+
+        # Simulation stages
+        output = None
+        for engine in engines:
+            output = measure(results, 'Engine.simulate[' + engine + ']', lambda waited: simulate(engine, waited), time_steps, pixels, memory)
+
+        steps = min(replenish_steps, time_steps)
+        measure(results, 'Tile.replenish', lambda waited: replenish_loop(Tile.Tile(x_dim, y_dim, clock_freq), feed(blocks(), waited), steps),
+                steps, pixels, memory)
+
+        # Output stages, replaying the frames of the last engine
+        if output is not None:
+            frames = measure(results, 'Output.set_frame', lambda waited: replay(output, waited), len(output.time), pixels, memory)
+            measure(results, 'Output.save_xarray_to_hdf5', lambda waited: save(frames, waited), len(output.time), pixels, memory)
+
+    return {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'config': dict(synthetic, time_steps=time_steps, x_dim=x_dim, y_dim=y_dim, engines=list(engines),
+                       replenish_steps=replenish_steps, csv=csv, clock_freq=clock_freq, block_size=block_size, memory=memory),
+        'stages': results,
+    }
+
+def commit():
+    """
+    Get the git commit of the code being benchmarked.
+
+    Returns:
+        str: The commit hash, None outside a git repository.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    """
+    Run the benchmark from the command line and write the results to a JSON file.
+
+    Args:
+        argv (list): Command line arguments, sys.argv by default.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the simulation on synthetic input.")
+    parser.add_argument('--time-steps', type=int, default=100000, help="number of time stamps of the synthetic input")
+    parser.add_argument('--x-dim', type=int, default=8, help="number of rows of pixels in the tile")
+    parser.add_argument('--y-dim', type=int, default=8, help="number of columns of pixels in the tile")
+    parser.add_argument('--engines', nargs='+', default=['ticks', 'events'], choices=Engine.ENGINES, help="engines to benchmark")
+    parser.add_argument('--replenish-steps', type=int, default=100000, help="number of time steps of the Tile.replenish benchmark")
+    parser.add_argument('--no-csv', action='store_true', help="generate the input in memory instead of parsing a CSV file")
+    parser.add_argument('--background', type=float, default=Synthetic.BACKGROUND_CHARGE, help="mean background charge per pixel per ns [C]")
+    parser.add_argument('--signal-rate', type=float, default=Synthetic.SIGNAL_RATE, help="probability of a signal hit per pixel per ns")
+    parser.add_argument('--signal-charge', type=float, default=Synthetic.SIGNAL_CHARGE, help="mean charge of a signal hit [C]")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic input and of the noise")
+    parser.add_argument('--clock-freq', type=int, default=Pixel.CLOCK_FREQ, help="clock period in nanoseconds")
+    parser.add_argument('--folder', help="folder for the temporary files")
+    parser.add_argument('--block-size', type=int, default=Input.BLOCK_SIZE, help="number of time stamps streamed through the stages at once")
+    parser.add_argument('--no-memory', action='store_true', help="skip the second, traced run of every stage that measures its peak memory")
+    parser.add_argument('--output', default='bench_results.json', help="JSON file to write the results to")
+    args = parser.parse_args(argv)
+
+    report = run(args.time_steps, args.x_dim, args.y_dim, tuple(args.engines), args.replenish_steps, not args.no_csv,
+                 args.background, args.signal_rate, args.signal_charge, args.seed, args.clock_freq, args.folder, args.block_size, not args.no_memory)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    print(f"Benchmark results saved to: {args.output}")
+
+if __name__ == '__main__':
+    main()
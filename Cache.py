@@ -0,0 +1,205 @@
+import numpy as np
+import hashlib
+import os
+import Input
+
+# Folder holding the binary copies of parsed CSV files
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'ReplenishSimulator')
+
+# Maximum size of the cache folder on disk in bytes, least recently used entries are removed first
+MAX_CACHE_BYTES = 10 * 2**30
+
+# Number of bytes hashed at the beginning and at the end of a file to fingerprint its content
+HASH_BYTES = 2**20
+
+def path_key(path):
+    """
+    Get the part of the cache key identifying a source file by its location.
+
+    Args:
+        path (str): Path to the CSV file.
+
+    Returns:
+        str: Hex digest of the absolute path.
+    """
+    return hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+
+def fingerprint(path):
+    """
+    Get the part of the cache key identifying the content of a source file.
+
+    The fingerprint combines the size and modification time of the file with a hash
+    of its first and last HASH_BYTES bytes, so it is cheap even for multi-GB files.
+
+    Args:
+        path (str): Path to the CSV file.
+
+    Returns:
+        str: Hex digest of the file size, modification time and content hash.
+    """
+    stat = os.stat(path)
+    digest = hashlib.sha256(f"{stat.st_size}:{stat.st_mtime_ns}:".encode())
+    with open(path, 'rb') as file:
+        digest.update(file.read(HASH_BYTES))
+        if stat.st_size > HASH_BYTES:
+            file.seek(max(HASH_BYTES, stat.st_size - HASH_BYTES))
+            digest.update(file.read(HASH_BYTES))
+    return digest.hexdigest()[:16]
+
+def cache_path(path, cache_dir=CACHE_DIR):
+    """
+    Get the location of the binary copy of a CSV file in the cache.
+
+    Args:
+        path (str): Path to the CSV file.
+        cache_dir (str): Folder holding the cache.
+
+    Returns:
+        str: Path to the .npy file for the current content of the CSV file.
+    """
+    return os.path.join(cache_dir, path_key(path) + '-' + fingerprint(path) + '.npy')
+
+def count_rows(path):
+    """
+    Count the data rows (non-empty lines after the header) of a CSV file without parsing them.
+
+    Args:
+        path (str): Path to the CSV file.
+
+    Returns:
+        int: Number of data rows.
+    """
+    with open(path, 'rb') as file:
+        next(file, None)  # Skip the header row
+        return sum(1 for line in file if line.strip())
+
+def store(path, destination, block_size=Input.BLOCK_SIZE):
+    """
+    Parse a CSV file block by block into a .npy file.
+
+    The .npy file is written under a temporary name and moved into place once complete,
+    so an interrupted conversion never leaves a truncated entry in the cache.
+
+    Args:
+        path (str): Path to the CSV file.
+        destination (str): Path to the .npy file to create.
+        block_size (int): Number of rows parsed at once.
+    """
+    rows = count_rows(path)
+    blocks = Input.read_blocks(path, block_size)
+    first = next(blocks, np.empty((0, 0)))
+
+    temporary = destination + '.tmp'
+    array = np.lib.format.open_memmap(temporary, mode='w+', dtype=float, shape=(rows, first.shape[1]))
+    array[:len(first)] = first
+    start = len(first)
+    for block in blocks:
+        array[start:start + len(block)] = block
+        start += len(block)
+    array.flush()
+    del array
+    os.replace(temporary, destination)
+
+def load(path, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """
+    Get the content of a CSV file as a read-only memory-mapped NumPy 2D array.
+
+    The first call parses the CSV file and stores a binary copy in the cache, later calls
+    open that copy without parsing or copying it. The copy is replaced whenever the
+    CSV file changes.
+
+    Args:
+        path (str): Path to the CSV file.
+        cache_dir (str): Folder holding the cache.
+        max_bytes (int): Maximum size of the cache folder on disk in bytes.
+
+    Returns:
+        np.ndarray: A memory-mapped NumPy 2D array containing the data from the CSV file.
+    """
+    destination = cache_path(path, cache_dir)
+    if os.path.exists(destination):
+        # Mark the entry as recently used
+        os.utime(destination)
+    else:
+        # The content changed (or was never cached), drop stale copies before converting
+        invalidate(path, cache_dir)
+        os.makedirs(cache_dir, exist_ok=True)
+        store(path, destination)
+        prune(max_bytes, cache_dir, keep=destination)
+
+    return np.load(destination, mmap_mode='r')
+
+def read_blocks(path, block_size=Input.BLOCK_SIZE, cache_dir=CACHE_DIR):
+    """
+    Stream a CSV file through the cache as a sequence of NumPy 2D arrays of at most block_size rows.
+
+    Args:
+        path (str): Path to the CSV file.
+        block_size (int): Maximum number of rows (time stamps) per block.
+        cache_dir (str): Folder holding the cache.
+
+    Yields:
+        np.ndarray: A memory-mapped view of the next block of rows.
+    """
+    array = load(path, cache_dir)
+    for start in range(0, len(array), block_size):
+        yield array[start:start + block_size]
+
+def entries(cache_dir=CACHE_DIR):
+    """
+    List the entries of the cache.
+
+    Args:
+        cache_dir (str): Folder holding the cache.
+
+    Returns:
+        list: Paths to the .npy files in the cache, least recently used first.
+    """
+    if not os.path.isdir(cache_dir):
+        return []
+    files = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.npy')]
+    return sorted(files, key=os.path.getmtime)
+
+def invalidate(path=None, cache_dir=CACHE_DIR):
+    """
+    Remove cached copies of a CSV file, or the whole cache.
+
+    Args:
+        path (str): Path to the CSV file, None removes every entry.
+        cache_dir (str): Folder holding the cache.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    prefix = '' if path is None else path_key(path) + '-'
+    removed = 0
+    for entry in entries(cache_dir):
+        if os.path.basename(entry).startswith(prefix):
+            os.remove(entry)
+            removed += 1
+    return removed
+
+def prune(max_bytes=MAX_CACHE_BYTES, cache_dir=CACHE_DIR, keep=None):
+    """
+    Remove least recently used entries until the cache fits in max_bytes.
+
+    Args:
+        max_bytes (int): Maximum size of the cache folder on disk in bytes.
+        cache_dir (str): Folder holding the cache.
+        keep (str): Path to an entry that must not be removed (eg the one just created).
+
+    Returns:
+        int: Number of entries removed.
+    """
+    files = entries(cache_dir)
+    total = sum(os.path.getsize(entry) for entry in files)
+    removed = 0
+    for entry in files:
+        if total <= max_bytes:
+            break
+        if entry == keep:
+            continue
+        total -= os.path.getsize(entry)
+        os.remove(entry)
+        removed += 1
+    return removed
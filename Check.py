@@ -0,0 +1,79 @@
+import numpy as np
+import argparse
+import Output
+import Simulator
+import Synthetic
+
+# Configurations whose results must not depend on how the input is split: the default pixels of every
+# engine, and dead times and buffer windows longer than a clock period that run across block boundaries
+CONFIGS = (
+    dict(engine='step'),
+    dict(engine='ticks'),
+    dict(engine='events'),
+    dict(engine='events', dead_time=50),
+    dict(engine='events', buffer_time=45),
+    dict(engine='events', dead_time=35, buffer_time=80),
+    dict(engine='events', dead_time=50, units=1),
+)
+
+def sorted_events(output) -> dict:
+    """
+    Get the reset event log of an Output in a fixed order, so logs recorded in another order can be compared.
+
+    Args:
+        output (Output): The Output object holding the reset events.
+
+    Returns:
+        dict: One array per column of Output.EVENT_COLUMNS, sorted by frame, tile, x and y.
+    """
+    events = output.events()
+    order = np.lexsort((events['y'], events['x'], events['tile'], events['frame']))
+    return {name: np.asarray(column)[order] for name, column in events.items()}
+
+def check_block_split(arr, config, parts=7, chunk_size=1234) -> int:
+    """
+    Simulate the same input whole, block by block and chunk by chunk, and make sure the reset events are identical.
+
+    Args:
+        arr (np.ndarray): 2D array (time, 1 + pixel columns) as returned by Input.file_to_2d.
+        config (dict): Keyword arguments of Simulator.Simulator (engine, pixel parameters, units).
+        parts (int): Number of blocks the input is split into for Simulator.run_blocks.
+        chunk_size (int): Number of time stamps per chunk for Simulator.run_chunked.
+
+    Returns:
+        int: Number of resets of the run.
+    Raises:
+        Exception: If a split run does not record exactly the resets of the whole run.
+    """
+    whole = sorted_events(Simulator.Simulator(**config).run(arr))
+    splits = {
+        'run_blocks': Simulator.Simulator(**config).run_blocks(np.array_split(arr, parts)),
+        'run_chunked': Simulator.Simulator(**config).run_chunked(arr, chunk_size),
+    }
+    for name, output in splits.items():
+        events = sorted_events(output)
+        if not all(np.array_equal(whole[column], events[column]) for column in Output.EVENT_COLUMNS):
+            raise Exception(name + " records " + str(len(events['x'])) + " resets with " + str(config) + ", the whole run " + str(len(whole['x'])) + ".")
+    return len(whole['x'])
+
+def main(argv=None):
+    """
+    Run the block split checks on synthetic input from the command line.
+
+    Args:
+        argv (list): Command line arguments, sys.argv by default.
+    """
+    parser = argparse.ArgumentParser(description="Check that split runs give the same resets as whole runs.")
+    parser.add_argument('--time-steps', type=int, default=20000, help="number of time stamps of the synthetic input")
+    parser.add_argument('--seed', type=int, default=3, help="seed of the synthetic input")
+    parser.add_argument('--parts', type=int, default=7, help="number of blocks the input is split into")
+    args = parser.parse_args(argv)
+
+    # 8x8 pixels, the default tile
+    arr = Synthetic.generate(args.time_steps, 64, seed=args.seed)
+    for config in CONFIGS:
+        print("{:<60} {:>8} resets".format(str(config), check_block_split(arr, config, args.parts)))
+    print("Every split run matches the whole run.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+import numpy as np
+import json
+import os
+
+# Default time in seconds between two checkpoints of a long run
+CHECKPOINT_SECONDS = 600.0
+
+def save(path, index, tiles, output=None, envir=None, writer=None) -> str:
+    """
+    Save the state of a simulation to a compact binary (.npz) file.
+
+    The file is written next to its destination and then moved over it, so a crash while
+    checkpointing leaves the previous checkpoint intact.
+
+    Args:
+        path (str): Path to the checkpoint file.
+        index (int): Number of time steps of the input simulated so far.
+        tiles (list): The Tile object of every tile.
+        output (Output): The Output object of the run, its frame time stamps, in-memory events and statistics are saved.
+        envir (Environment.Noise): Noise source of the run, the position of its streams is saved.
+        writer (Writer.EventWriter): Writer of the run, it is flushed and its position is saved.
+
+    Returns:
+        str: Path to the checkpoint file.
+    """
+    path = os.path.expanduser(path)
+    states = [tile.state() for tile in tiles]
+    arrays = {name: np.stack([state[name] for state in states]) for name in states[0]}
+    arrays['index'] = np.array(index)
+
+    if output is not None:
+        arrays.update({'output_' + name: values for name, values in output.state().items()})
+        if output.statistics is not None:
+            arrays.update({'statistics_' + name: values for name, values in output.statistics.state().items()})
+
+    # Generator states hold 128-bit integers, they are kept as JSON text
+    if envir is not None and hasattr(envir, 'state'):
+        arrays['envir'] = np.array(json.dumps(envir.state()))
+    if writer is not None:
+        arrays['writer'] = np.array(json.dumps(writer.position()))
+
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as file:
+        np.savez_compressed(file, **arrays)
+    os.replace(temporary, path)
+    return path
+
+def load(path) -> dict:
+    """
+    Load a checkpoint written by save.
+
+    Args:
+        path (str): Path to the checkpoint file.
+
+    Returns:
+        dict: 'index' (time steps simulated), 'tiles' (one state per tile, see Tile.state), 'output'
+            (see Output.state, None if not saved), 'statistics' (see Statistics.state, None if not saved), 'envir' (see Environment.Noise.state, None if not saved)
+            and 'writer' (see Writer.EventWriter.position, None if not saved).
+    """
+    with np.load(os.path.expanduser(path)) as file:
+        state = {
+            'index': int(file['index']),
+            'tiles': [{name: file[name][k] for name in ('charge', 'prev_time', 'active', 'dead_until', 'hold_until', 'units') if name in file.files} for k in range(len(file['charge']))],
+            'output': {name[len('output_'):]: file[name] for name in file.files if name.startswith('output_')} or None,
+            'statistics': {name[len('statistics_'):]: file[name] for name in file.files if name.startswith('statistics_')} or None,
+            'envir': json.loads(str(file['envir'])) if 'envir' in file.files else None,
+            'writer': json.loads(str(file['writer'])) if 'writer' in file.files else None,
+        }
+    return state
+
+def restore(state, tiles, output=None, envir=None) -> int:
+    """
+    Bring a simulation back to a checkpoint, to resume it or to fork a what-if run from it.
+
+    The tiles only take the pixel state from the checkpoint, so a fork may use different pixel
+    parameters, and the charge is converted to their units (eg a run in integer counts forked
+    into a run in float coulombs). A writer has to be opened at the saved position first (see Writer.EventWriter).
+
+    Args:
+        state (dict): Checkpoint as returned by load.
+        tiles (list): The Tile object of every tile.
+        output (Output): The Output object to restore the frame time stamps, events and statistics into.
+        envir (Environment.Noise): Noise source to move back to the saved position of its streams.
+
+    Returns:
+        int: Number of time steps of the input already simulated, ie the index to continue from.
+    Raises:
+        Exception: If the checkpoint does not have the same number of tiles.
+    """
+    if len(state['tiles']) != len(tiles):
+        raise Exception("Checkpoint has " + str(len(state['tiles'])) + " tile(s), the simulation has " + str(len(tiles)) + ".")
+    for tile, tile_state in zip(tiles, state['tiles']):
+        tile.set_state(tile_state)
+    if output is not None and state['output'] is not None:
+        output.set_state(state['output'])
+    if output is not None and output.statistics is not None:
+        if state.get('statistics') is not None:
+            output.statistics.set_state(state['statistics'])
+        else:
+            # Without saved statistics they are rebuilt from the restored events
+            output.statistics.clear()
+            if state['output'] is not None:
+                events = state['output']
+                output.statistics.extend(events['time'])
+                output.statistics.add(events['x'], events['y'], events['current'], events['tile'])
+    if envir is not None and state['envir'] is not None:
+        envir.set_state(state['envir'])
+    return state['index']
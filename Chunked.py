@@ -0,0 +1,190 @@
+import numpy as np
+import xarray as xr
+import time as clock
+import dask
+import dask.array as da
+from concurrent.futures import ThreadPoolExecutor
+import Cache
+import Checkpoint
+import Engine
+import Geometry
+import Input
+import Output
+import Pixel
+import Tile
+
+def read_rows(data, start, stop) -> np.ndarray:
+    """
+    Copy a range of rows of the input data into memory.
+
+    Args:
+        data (np.ndarray): 2D array (time, 1 + pixel columns), usually memory-mapped.
+        start (int): Index of the first row.
+        stop (int): Index after the last row.
+
+    Returns:
+        np.ndarray: The rows.
+    """
+    return np.array(data[start:stop])
+
+def open_array(source, geometry=None, chunk_size=Input.BLOCK_SIZE) -> xr.DataArray:
+    """
+    Open input data as a lazy, dask-backed xarray chunked along time.
+
+    Nothing is read until a chunk is computed, so with a memory-mapped source (eg a CSV file
+    through the binary cache) only the chunks being simulated are ever held in memory.
+
+    Args:
+        source (str or np.ndarray): Path to a CSV file (memory-mapped through Cache.load), or a 2D array
+            (time, 1 + pixel columns) as returned by Input.file_to_2d.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping, a single 8x8 tile by default.
+        chunk_size (int): Number of time stamps per chunk.
+
+    Returns:
+        xr.DataArray: A (time, x, y) xarray, or (time, tile, x, y) for a geometry with several tiles,
+            without any environment factor applied.
+    """
+    geometry = Geometry.Geometry() if geometry is None else geometry
+    data = Cache.load(source) if isinstance(source, str) else source
+
+    # One delayed read per chunk, so the graph references the (memory-mapped) data instead of copying it
+    starts = range(0, len(data), chunk_size)
+    lazy = da.concatenate([da.from_delayed(dask.delayed(read_rows)(data, start, min(start + chunk_size, len(data)), dask_key_name=('rows', id(data), i)),
+                                           (min(start + chunk_size, len(data)) - start, data.shape[1]), data.dtype)
+                           for i, start in enumerate(starts)])
+
+    # Gather the pixel columns of every tile, one chunk at a time
+    grids = lazy[:, 1:][:, geometry.columns.ravel()].reshape((-1,) + geometry.columns.shape)
+    x_coords = np.arange(geometry.x_dim)
+    y_coords = np.arange(geometry.y_dim)
+    time_stamps = np.asarray(data[:, 0])
+    if geometry.tiles == 1:
+        return xr.DataArray(grids[:, 0], dims=('time', 'x', 'y'), coords={'time': time_stamps, 'x': x_coords, 'y': y_coords})
+    return xr.DataArray(grids, dims=('time', 'tile', 'x', 'y'), coords={'time': time_stamps, 'tile': np.arange(geometry.tiles), 'x': x_coords, 'y': y_coords})
+
+def load_chunk(arr, start, stop, geometry, envir=None, units=None, dtype=None, transport=None) -> np.ndarray:
+    """
+    Compute one chunk of a (possibly dask-backed) xarray and apply the environment factor to it.
+
+    Chunks have to be loaded in time order: stateful environments such as Environment.Noise
+    continue their streams from one chunk to the next, so the noise is the same as if the whole
+    recording was loaded at once.
+
+    Args:
+        arr (xr.DataArray): Input data as returned by open_array or Input.three_d_array.
+        start (int): Index of the first time step of the chunk.
+        stop (int): Index after the last time step of the chunk.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping of the detector.
+        envir (callable): Function to apply an environment factor to the data, see Input.apply_environment.
+        units (int): Quantize the charge to integer counts of 1/units electron, None keeps coulombs.
+        dtype (type): Type the charge is stored as, see Input.three_d_array.
+        transport (Environment.Transport): Drift of the charge to the pixels, applied on the grid before the environment factor.
+
+    Returns:
+        np.ndarray: A (time, tile, x, y) array of charge values.
+    Raises:
+        Exception: If dtype does not match units, see Input.check_dtype.
+    """
+    Input.check_dtype(units, dtype)
+    values = np.asarray(arr[start:stop].values)
+    values = values.reshape((len(values), geometry.tiles, geometry.x_dim, geometry.y_dim))
+    if transport is not None:
+        values = transport.spread(values)
+
+    # Draw the noise in the layout of the input columns so it matches the whole-file path, then arrange it on the grid
+    if envir is not None:
+        noise = envir(noise_vector_size=(len(values), geometry.pixels))
+        values = values + geometry.grid(noise).reshape(values.shape) * Pixel.ELECTRON_CHARGE
+
+    if units is not None:
+        return Input.quantize(values, units, np.int64 if dtype is None else dtype)
+    if dtype is not None:
+        return values.astype(dtype)
+    return values
+
+def simulate_chunk(tile, data, times, start, engine) -> Output.Output:
+    """
+    Simulate one chunk of one tile (runs in a worker thread).
+
+    Args:
+        tile (Tile): The Tile object of the tile, its state is carried to the next chunk.
+        data (np.ndarray): 3D array (time, x, y) of charge values of the chunk.
+        times (np.ndarray): Time stamps of the chunk.
+        start (int): Index of the first time step of the chunk in the whole recording.
+        engine (str): One of Engine.ENGINES.
+
+    Returns:
+        Output: An Output object holding the reset events of the chunk.
+    """
+    arr_3d = xr.DataArray(data, dims=('time', 'x', 'y'), coords={'time': times})
+    output = Output.Output([])
+    Engine.simulate(tile, arr_3d, output, start, engine)
+    return output
+
+def simulate(arr, output, geometry=None, envir=None, clock_freq=Pixel.CLOCK_FREQ, engine='ticks', threads=None, units=None, dtype=None,
+             checkpoint=None, checkpoint_seconds=Checkpoint.CHECKPOINT_SECONDS, resume=None, transport=None, **pixel_params) -> list:
+    """
+    Simulate a recording chunk by chunk, with the tiles of each chunk processed concurrently by a pool of threads.
+
+    Only one chunk of the input is computed at a time and every tile keeps its state from one chunk
+    to the next, so the result is the same as simulating the whole recording at once. With an
+    Output streaming to a Writer.EventWriter (keep=False) the reset events are written chunk by
+    chunk as well, so the memory is bounded by the chunk size however long the recording is.
+
+    Long runs can save a checkpoint (tile state, time index, noise streams and writer position)
+    between chunks and be resumed from it with results identical to an uninterrupted run. The same
+    checkpoint can also start any number of what-if runs from a shared warmed-up state.
+
+    Args:
+        arr (xr.DataArray): Input data chunked along time, as returned by open_array (dask-backed) or Input.three_d_array.
+        output (Output): The Output object to store simulation results, it grows with every chunk.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping, a single 8x8 tile by default.
+        envir (callable): Function to apply an environment factor to the data, see Input.apply_environment.
+        clock_freq (int): Clock period in nanoseconds.
+        engine (str): One of Engine.ENGINES.
+        threads (int): Number of worker threads, the ThreadPoolExecutor default by default.
+        units (int): Account charge as exact integer counts of 1/units electron, None keeps float coulombs.
+        dtype (type): Type the charge is stored as, see Input.three_d_array.
+        checkpoint (str): Path to save a checkpoint to, every checkpoint_seconds and at the end of the recording.
+        checkpoint_seconds (float): Time between two checkpoints.
+        resume (str or dict): Checkpoint (path or as returned by Checkpoint.load) to continue from. A writer of
+            'output' has to be opened at the position saved in the checkpoint (or be a new file for a fork).
+        transport (Environment.Transport): Drift of the charge to the pixels, see load_chunk.
+        **pixel_params: Keyword arguments forwarded to Tile.Tile (e.g. reset, life_time, w_value).
+
+    Returns:
+        list: The Tile object of every tile, holding the pixel state at the end of the recording.
+    """
+    geometry = Geometry.Geometry() if geometry is None else geometry
+    tiles = [Tile.Tile(geometry.x_dim, geometry.y_dim, clock_freq, units, **pixel_params) for k in range(geometry.tiles)]
+    times = np.asarray(arr['time'].values, dtype=float)
+
+    # Follow the chunks of a dask-backed input, or cut an in-memory one into blocks
+    sizes = arr.chunks[0] if arr.chunks is not None else [Input.BLOCK_SIZE] * -(-len(times) // Input.BLOCK_SIZE)
+    stops = np.minimum(np.cumsum(sizes, dtype=np.int64), len(times))
+
+    # Pick up the state of a checkpoint, the first chunk may then start part way through
+    start = 0
+    if resume is not None:
+        state = Checkpoint.load(resume) if isinstance(resume, str) else resume
+        start = Checkpoint.restore(state, tiles, output, envir)
+    last_checkpoint = clock.monotonic()
+
+    with ThreadPoolExecutor(threads) as pool:
+        for stop in stops[stops > start]:
+            stop = int(stop)
+            data = load_chunk(arr, start, stop, geometry, envir, units, dtype, transport)
+
+            # Add the frames sampled within this chunk, then simulate every tile of it concurrently
+            output.extend(times[start:stop][-start % clock_freq::clock_freq])
+            futures = [pool.submit(simulate_chunk, tiles[k], data[:, k], times[start:stop], start, engine) for k in range(geometry.tiles)]
+            for k, future in enumerate(futures):
+                output.merge(future.result(), k)
+            del data
+            start = stop
+
+            if checkpoint is not None and (start == len(times) or clock.monotonic() - last_checkpoint >= checkpoint_seconds):
+                Checkpoint.save(checkpoint, start, tiles, output, envir, output.writer)
+                last_checkpoint = clock.monotonic()
+
+    return tiles
@@ -0,0 +1,221 @@
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import Engine
+import Geometry
+import Input
+import Output
+import Pixel
+import Tile
+
+def tile_block(data, geometry, k) -> np.ndarray:
+    """
+    Copy the time stamps and the pixel columns of one tile out of the detector data.
+
+    Args:
+        data (np.ndarray): 2D array (time, 1 + pixel columns) of the whole detector.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping of the detector.
+        k (int): Index of the tile.
+
+    Returns:
+        np.ndarray: A 2D array (time, 1 + x_dim * y_dim) laid out for a default one-tile Geometry.
+    """
+    # Default layout of a tile has pixel (x, y) in column y * x_dim + x
+    columns = 1 + geometry.columns[k].transpose().ravel()
+    return data[:, np.concatenate(([0], columns))]
+
+def fill(data, arr, envir=None, geometry=None, transport=None) -> None:
+    """
+    Copy detector data into a float64 array, applying the charge transport and the environment factor on the way.
+
+    Args:
+        data (np.ndarray): 2D float array of the shape of arr to fill.
+        arr (np.ndarray): 2D NumPy array (time, 1 + pixel columns) as returned by Input.file_to_2d.
+        envir (callable): Function to apply an environment factor to the data, see Input.apply_environment.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping of the detector, needed by transport.
+        transport (callable): Drift of the charge to the pixels, see Input.three_d_array.
+    """
+    data[:, 0] = arr[:, 0]
+    data[:, 1:] = Input.apply_environment(arr[:, 1:] if transport is None else transport(arr[:, 1:], geometry), envir)
+
+def share(arr, envir=None, geometry=None, transport=None) -> shared_memory.SharedMemory:
+    """
+    Copy detector data into a new block of shared memory, applying the charge transport and the environment factor on the way.
+
+    The caller owns the block and must close and unlink it once the workers are done.
+
+    Args:
+        arr (np.ndarray): 2D NumPy array (time, 1 + pixel columns) as returned by Input.file_to_2d.
+        envir (callable): Function to apply an environment factor to the data, see Input.apply_environment.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping of the detector, needed by transport.
+        transport (callable): Drift of the charge to the pixels, see Input.three_d_array.
+
+    Returns:
+        shared_memory.SharedMemory: The block of shared memory holding the data.
+    """
+    # The block holds float64 whatever the type of the input (eg float32 storage)
+    memory = shared_memory.SharedMemory(create=True, size=max(arr.shape[0] * arr.shape[1] * np.dtype(float).itemsize, 1))
+    try:
+        data = np.ndarray(arr.shape, dtype=float, buffer=memory.buf)
+        fill(data, arr, envir, geometry, transport)
+        del data  # No view of the shared memory may outlive it
+    except BaseException:
+        # The caller never gets the block, so it is released here
+        memory.close()
+        memory.unlink()
+        raise
+    return memory
+
+def share_noise(shape, envir) -> shared_memory.SharedMemory:
+    """
+    Draw the environment noise of detector data once into a new block of shared memory.
+
+    Used when the signal has to be transformed in the workers (eg a drift that differs between
+    configurations) before the noise is added. The caller owns the block and must close and
+    unlink it once the workers are done.
+
+    Args:
+        shape (tuple): Shape of the detector data (time, 1 + pixel columns).
+        envir (callable): Function drawing the noise, see Input.apply_environment.
+
+    Returns:
+        shared_memory.SharedMemory: The block of shared memory holding the noise in electrons, laid out like the data.
+    """
+    memory = shared_memory.SharedMemory(create=True, size=max(shape[0] * shape[1] * np.dtype(float).itemsize, 1))
+    try:
+        noise = np.ndarray(shape, dtype=float, buffer=memory.buf)
+        noise[:, 0] = 0
+        noise[:, 1:] = envir(noise_vector_size=(shape[0], shape[1] - 1))
+        del noise  # No view of the shared memory may outlive it
+    except BaseException:
+        memory.close()
+        memory.unlink()
+        raise
+    return memory
+
+def copy_tiles(name, shape, geometry, tiles) -> list:
+    """
+    Copy the data of some tiles out of shared memory (runs in a worker process).
+
+    Args:
+        name (str): Name of the shared memory block holding the detector data.
+        shape (tuple): Shape of the detector data.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping of the detector.
+        tiles (list): Indices of the tiles to copy.
+
+    Returns:
+        list: (tile index, 2D array as returned by tile_block) for every tile.
+    """
+    memory = shared_memory.SharedMemory(name=name)
+    try:
+        data = np.ndarray(shape, dtype=float, buffer=memory.buf)
+        blocks = [(k, tile_block(data, geometry, k)) for k in tiles]
+        del data  # No view of the shared memory may outlive it
+    finally:
+        memory.close()
+    return blocks
+
+def simulate_tiles(name, shape, geometry, tiles, clock_freq, engine, pixel_params, transport=None, noise=None, dtype=None) -> list:
+    """
+    Simulate some tiles of the detector from data held in shared memory (runs in a worker process).
+
+    Args:
+        name (str): Name of the shared memory block holding the detector data.
+        shape (tuple): Shape of the detector data.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping of the detector.
+        tiles (list): Indices of the tiles to simulate.
+        clock_freq (int): Clock period in nanoseconds.
+        engine (str): One of Engine.ENGINES.
+        pixel_params (dict): Keyword arguments forwarded to Tile.Tile.
+        transport (callable): Drift of the charge to the pixels applied to every tile, see Input.three_d_array.
+        noise (str): Name of the shared memory block holding the noise added after the drift (see share_noise), None adds nothing.
+        dtype (type): Type the charge of every tile is stored as, see Input.three_d_array.
+
+    Returns:
+        list: (tile index, Output of the tile) for every simulated tile.
+    """
+    results = []
+    tile_geometry = Geometry.Geometry(geometry.x_dim, geometry.y_dim)
+    noise_blocks = dict(copy_tiles(noise, shape, geometry, tiles)) if noise is not None else {}
+    for k, block in copy_tiles(name, shape, geometry, tiles):
+        # Drift the charge of the tile, then add its share of the noise the same way Input.apply_environment does
+        if transport is not None:
+            block[:, 1:] = transport(block[:, 1:], tile_geometry)
+        if k in noise_blocks:
+            block[:, 1:] = block[:, 1:] + noise_blocks[k][:, 1:] * Pixel.ELECTRON_CHARGE
+        results.append((k, simulate_block(block, tile_geometry, clock_freq, engine, pixel_params, dtype)))
+    return results
+
+def simulate_block(block, tile_geometry, clock_freq, engine, pixel_params, dtype=None) -> Output.Output:
+    """
+    Simulate one tile of the detector over its own columns of the data.
+
+    Args:
+        block (np.ndarray): 2D array (time, 1 + x_dim * y_dim) of the tile, as returned by tile_block.
+        tile_geometry (Geometry): Default one-tile Geometry of the tile dimensions.
+        clock_freq (int): Clock period in nanoseconds.
+        engine (str): One of Engine.ENGINES.
+        pixel_params (dict): Keyword arguments forwarded to Tile.Tile.
+        dtype (type): Type the charge of the tile is stored as, see Input.three_d_array.
+
+    Returns:
+        Output: The Output of the tile.
+    """
+    arr_3d = Input.three_d_array(block, None, tile_geometry, pixel_params.get('units'), dtype)
+    output = Output.Output(block[::clock_freq, 0], tile_geometry)
+    tile = Tile.Tile(tile_geometry.x_dim, tile_geometry.y_dim, clock_freq, **pixel_params)
+    Engine.simulate(tile, arr_3d, output, engine=engine)
+    return output
+
+def simulate(arr, geometry, envir=None, clock_freq=Pixel.CLOCK_FREQ, engine='ticks', processes=None, transport=None, statistics=None, dtype=None, **pixel_params) -> Output.Output:
+    """
+    Simulate a detector made of several tiles, splitting the tiles across a pool of processes.
+
+    The input (with the environment factor applied) is placed once in shared memory and every
+    worker copies out only the columns of its own tiles. With a single process the tiles are
+    simulated one after the other in this process instead. The results are merged into one Output
+    with 'tile', 'x' and 'y' coordinates.
+
+    Args:
+        arr (np.ndarray): 2D NumPy array (time, 1 + pixel columns) as returned by Input.file_to_2d.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping of the detector.
+        envir (callable): Function to apply an environment factor to the data, see Input.apply_environment.
+        clock_freq (int): Clock period in nanoseconds.
+        engine (str): One of Engine.ENGINES.
+        processes (int): Number of worker processes, one per tile up to the number of CPUs by default. 1 simulates in this process.
+        transport (callable): Drift of the charge to the pixels, see Input.three_d_array.
+        statistics (Statistics.Statistics): Online statistics updated with the resets of every tile as they are merged.
+        dtype (type): Type the charge of every tile is stored as in the workers, see Input.three_d_array.
+        **pixel_params: Keyword arguments forwarded to Tile.Tile (e.g. reset, life_time, w_value).
+
+    Returns:
+        Output: The Output object holding the results of every tile.
+    """
+    if processes is None:
+        processes = min(os.cpu_count() or 1, geometry.tiles)
+
+    output = Output.Output(arr[::clock_freq, 0], geometry, statistics=statistics)
+    if processes == 1:
+        # No worker to share the input with, the tiles take their columns from one local copy
+        data = np.empty(arr.shape)
+        fill(data, arr, envir, geometry, transport)
+        tile_geometry = Geometry.Geometry(geometry.x_dim, geometry.y_dim)
+        for k in range(geometry.tiles):
+            output.merge(simulate_block(tile_block(data, geometry, k), tile_geometry, clock_freq, engine, pixel_params, dtype), k)
+        return output
+
+    memory = share(arr, envir, geometry, transport)
+    try:
+        # Give every worker a contiguous share of the tiles
+        shards = [list(shard) for shard in np.array_split(np.arange(geometry.tiles), processes) if len(shard)]
+        with ProcessPoolExecutor(len(shards)) as pool:
+            futures = [pool.submit(simulate_tiles, memory.name, arr.shape, geometry, shard, clock_freq, engine, pixel_params, dtype=dtype) for shard in shards]
+            for future in futures:
+                for k, tile_output in future.result():
+                    output.merge(tile_output, k)
+    finally:
+        memory.close()
+        memory.unlink()
+
+    return output
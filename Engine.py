@@ -0,0 +1,140 @@
+import numpy as np
+import Instrument
+import Pixel
+import Scheduler
+
+# Simulation engines:
+#   'step'   - evaluate the tile every nanosecond
+#   'ticks'  - only evaluate the tile on clock ticks, summing the charge in between (same output as 'step')
+#   'events' - jump from reset to reset with a priority queue, honoring the pixels' dead time and buffer window
+ENGINES = ('step', 'ticks', 'events')
+
+# Pixel parameters only the 'events' engine models
+EVENT_PARAMETERS = ('dead_time', 'buffer_time')
+
+def check_parameters(engine, pixel_params) -> None:
+    """
+    Make sure an engine models every pixel parameter given, so a run never quietly ignores one.
+
+    Args:
+        engine (str): One of ENGINES.
+        pixel_params (dict): Keyword arguments of Tile.Tile.
+    Raises:
+        Exception: If a parameter only the 'events' engine models is set to anything but its default with another engine.
+    """
+    if engine == 'events':
+        return
+    defaults = Pixel.Pixel(id=None)
+    for name in EVENT_PARAMETERS:
+        if name in pixel_params and pixel_params[name] != getattr(defaults, name):
+            raise Exception("'" + name + "' has no effect with the '" + engine + "' engine, only the 'events' engine models it.")
+
+def iterate(tile, arr, output, start=0):
+    """
+    Iterate over time and update the 'tile' object and 'output' (executing replenishes)
+
+    Parameters:
+        tile (Tile): The Tile object representing a grid of pixels.
+        arr (xarray): The 3D xarray containing data over time and coordinates.
+        output (Output): The Output object to store simulation results.
+        start (int): Index of the first time step of 'arr' in the whole recording (when streaming blocks).
+    """
+    # Get the dimensions of the 3D xarray
+    time_dim, x_dim, y_dim = arr.dims
+
+    # Loop over each time step
+    for t in range(len(arr[time_dim])):
+        # Index the xarray for the current time step and coordinates
+        begin = Instrument.start()
+        frame, time = arr[t], arr[time_dim][t]
+        Instrument.stop('xarray indexing', begin)
+
+        # Replenish the 'tile' with data for the current time step and coordinates
+        begin = Instrument.start()
+        status = tile.replenish(frame, time)
+        Instrument.stop('Tile.replenish', begin)
+
+        # Store the status for every 'clock_freq' time step in 'output' (ie only store data at every clock tick - and therefore replenish)
+        if (start + t) % tile.clock_freq == 0:
+            output.set_frame(t=int((start + t)/tile.clock_freq), arr=status)
+
+def iterate_ticks(tile, arr, output, start=0):
+    """
+    Iterate over clock ticks only and update the 'tile' object and 'output' (executing replenishes)
+
+    Between two ticks a pixel only accumulates charge, so all the samples of a clock period are
+    handed to the tile at once and the replenish decision is made once per tick. The frames
+    written to 'output' are identical to the ones produced by 'iterate'.
+
+    Parameters:
+        tile (Tile): The Tile object representing a grid of pixels.
+        arr (xarray): The 3D xarray containing data over time and coordinates.
+        output (Output): The Output object to store simulation results.
+        start (int): Index of the first time step of 'arr' in the whole recording (when streaming blocks).
+    """
+    # Get the dimensions of the 3D xarray
+    time_dim, x_dim, y_dim = arr.dims
+
+    # Pull the raw data out of the xarray once (in the units of the tile) instead of indexing it every time step
+    data = tile.convert(arr.values)
+    times = np.asarray(arr[time_dim].values, dtype=float)
+
+    # Indices of the samples that fall on a clock tick, and the first sample of each clock period
+    ticks = np.flatnonzero(times.astype(int) % tile.clock_freq == 0)
+    starts = np.concatenate(([0], ticks + 1))
+
+    # Step the tile once per tick with all the charge collected since the previous tick
+    for i, t in enumerate(ticks):
+        begin = Instrument.start()
+        status = tile.replenish_interval(data[starts[i]:t + 1], times[t])
+        Instrument.stop('Tile.replenish_interval', begin)
+        if (start + t) % tile.clock_freq == 0:
+            output.set_frame(t=int((start + t)/tile.clock_freq), arr=status)
+
+    # Charge arriving after the last tick is still collected on the capacitors
+    if starts[-1] < len(times):
+        tile.replenish_interval(data[starts[-1]:], times[-1])
+
+@Instrument.timed('Engine.simulate')
+def simulate(tile, arr, output, start=0, engine='ticks'):
+    """
+    Run a simulation engine over 'arr' and update the 'tile' object and 'output'
+
+    Parameters:
+        tile (Tile): The Tile object representing a grid of pixels.
+        arr (xarray): The 3D xarray containing data over time and coordinates.
+        output (Output): The Output object to store simulation results.
+        start (int): Index of the first time step of 'arr' in the whole recording (when streaming blocks).
+        engine (str): One of ENGINES.
+    """
+    if engine not in ENGINES:
+        raise Exception("Unknown engine '" + str(engine) + "', expected one of " + ", ".join(ENGINES) + ".")
+
+    if engine == 'events':
+        Scheduler.Scheduler(tile, arr, start).run(output)
+    elif engine == 'ticks':
+        iterate_ticks(tile, arr, output, start)
+    else:
+        iterate(tile, arr, output, start)
+
+def iterate_blocks(tile, blocks, output, engine='ticks'):
+    """
+    Simulate a recording delivered as consecutive blocks of time steps, growing 'output' as it goes
+
+    The 'tile' keeps its state from one block to the next, so the result is the same as simulating
+    the whole recording at once while only one block is held in memory.
+
+    Parameters:
+        tile (Tile): The Tile object representing a grid of pixels.
+        blocks (iterable): 3D xarrays containing consecutive blocks of data over time and coordinates.
+        output (Output): The Output object to store simulation results.
+        engine (str): One of ENGINES.
+    """
+    start = 0
+    for arr in blocks:
+        times = np.array(arr[arr.dims[0]])
+
+        # Add the frames sampled within this block to the output, then simulate it
+        output.extend(times[-start % tile.clock_freq::tile.clock_freq])
+        simulate(tile, arr, output, start, engine)
+        start += len(times)
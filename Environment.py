@@ -1,35 +1,339 @@
 import numpy as np
+import math
+import Pixel
 
-def make_gaussian_noise(sigma=1e-12, noise_vector_size=64):
+# Probability of 100 attocoulombs leakage current (625 electrons per second)
+LEAKAGE_PROBABILITY = 625 / 1e8
+
+# Number of time steps Transport convolves at once, bounding the memory of the Fourier transforms
+TRANSPORT_BLOCK = 65536
+
+def draw_noise(electronics_rng, leakage_rng, size, sigma=1e-12, leakage_probability=LEAKAGE_PROBABILITY, poisson=False):
+    """
+    Draw a batch of simulated noise with Gaussian distribution and leakage current events.
+
+    Parameters:
+    electronics_rng (numpy.random.Generator): Generator for the electronics noise.
+    leakage_rng (numpy.random.Generator): Generator for the leakage current events.
+    size (int or tuple): Shape of the noise array.
+    sigma (float): Standard deviation for Gaussian noise.
+    leakage_probability (float): Probability (or mean number, if poisson) of a leakage electron per element.
+    poisson (bool): Draw the number of leakage electrons from a Poisson distribution instead of at most one.
+
+    Returns:
+    numpy.ndarray: An array containing the simulated noise values in electrons.
+    """
+    # Generate random noise from Gaussian distribution with mean 0 and standard deviation sigma
+    electronics = np.rint(electronics_rng.normal(0, sigma, size))
+
+    # Determine if there's a leakage current event
+    if poisson:
+        leakage_current = leakage_rng.poisson(leakage_probability, size)
+    else:
+        leakage_current = leakage_rng.random(size) < leakage_probability
+
+    return electronics + leakage_current
+
+def make_gaussian_noise(sigma=1e-12, noise_vector_size=64, rng=None):
     """
     Generate a vector of simulated noise with Gaussian distribution and leakage current events.
 
     Parameters:
     sigma (float): Standard deviation for Gaussian noise.
-    noise_vector_size (int): Number of elements in the noise vector.
+    noise_vector_size (int or tuple): Number of elements (or shape) of the noise vector.
+    rng (numpy.random.Generator): Generator to draw from, a freshly seeded one if None.
+
+    Returns:
+    numpy.ndarray: An array containing the simulated noise values in electrons.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    return draw_noise(rng, rng, noise_vector_size, sigma)
+
+class Noise:
+    def __init__(self, sigma=1e-12, leakage_probability=LEAKAGE_PROBABILITY, poisson=False, seed=None, per_pixel=False) -> None:
+        """
+        Initialize a seeded noise source that can be used as the 'envir' of Input.three_d_array.
+
+        The electronics noise and the leakage events come from two independent streams, so
+        generating the noise in consecutive chunks of time gives the same values as generating
+        it all at once. With per_pixel every pixel (last axis) also gets its own pair of streams,
+        which makes a pixel's noise independent of how many pixels are simulated alongside it.
+
+        Parameters:
+        sigma (float): Standard deviation for Gaussian noise.
+        leakage_probability (float): Probability (or mean number, if poisson) of a leakage electron per element.
+        poisson (bool): Draw the number of leakage electrons from a Poisson distribution instead of at most one.
+        seed (int): Seed of the noise, None draws a fresh one (available as the 'seed' attribute to reproduce the run).
+        per_pixel (bool): Use an independent pair of streams for every pixel.
+        """
+        self.sigma = sigma
+        self.leakage_probability = leakage_probability
+        self.poisson = poisson
+        self.per_pixel = per_pixel
+        self.sequence = np.random.SeedSequence(seed)
+        self.seed = self.sequence.entropy
+
+        # Shared streams, and per-pixel streams created once the number of pixels is known
+        self.electronics, self.leakage = [np.random.default_rng(s) for s in self.sequence.spawn(2)]
+        self.pixel_streams = []
+
+    def add_pixel_streams(self, pixels):
+        """
+        Create the per-pixel streams up to a number of pixels.
+
+        Parameters:
+        pixels (int): Number of pixels that need a pair of streams.
+        """
+        while len(self.pixel_streams) < pixels:
+            # Pixel k draws from the (2, k) branch of the seed, (0,) and (1,) being the shared streams
+            sequence = np.random.SeedSequence(self.seed, spawn_key=(2, len(self.pixel_streams)))
+            self.pixel_streams.append([np.random.default_rng(s) for s in sequence.spawn(2)])
+
+    def state(self):
+        """
+        Get the position of every stream, eg to checkpoint a long run.
+
+        Returns:
+        dict: The bit generator state of the shared streams ('electronics', 'leakage') and of every pixel's pair ('pixels').
+        """
+        return {
+            'electronics': self.electronics.bit_generator.state,
+            'leakage': self.leakage.bit_generator.state,
+            'pixels': [[rng.bit_generator.state for rng in streams] for streams in self.pixel_streams],
+        }
+
+    def set_state(self, state):
+        """
+        Move every stream back to a position returned by state, so the noise continues exactly from there.
+
+        Parameters:
+        state (dict): The bit generator states returned by state.
+        """
+        self.electronics.bit_generator.state = state['electronics']
+        self.leakage.bit_generator.state = state['leakage']
+        self.add_pixel_streams(len(state['pixels']))
+        for streams, states in zip(self.pixel_streams, state['pixels']):
+            for rng, rng_state in zip(streams, states):
+                rng.bit_generator.state = rng_state
+
+    def __call__(self, noise_vector_size=64):
+        """
+        Generate the next chunk of the noise field.
+
+        Parameters:
+        noise_vector_size (int or tuple): Shape of the chunk, pixels along the last axis (eg (time, pixels)).
+
+        Returns:
+        numpy.ndarray: An array containing the simulated noise values in electrons.
+        """
+        if not self.per_pixel:
+            return draw_noise(self.electronics, self.leakage, noise_vector_size, self.sigma, self.leakage_probability, self.poisson)
+
+        shape = tuple(np.atleast_1d(noise_vector_size))
+        self.add_pixel_streams(shape[-1])
+
+        # Every pixel's stream is drawn into a contiguous row, then the whole buffer is transposed once
+        noise = np.empty((shape[-1],) + shape[:-1])
+        for pixel in range(shape[-1]):
+            electronics, leakage = self.pixel_streams[pixel]
+            noise[pixel] = draw_noise(electronics, leakage, shape[:-1], self.sigma, self.leakage_probability, self.poisson)
+        return np.moveaxis(noise, 0, -1)
+
+def fft_length(n):
+    """
+    Get the length of a Fourier transform that can hold a linear convolution along an axis of n pixels.
+
+    Parameters:
+    n (int): Number of pixels along the axis.
 
     Returns:
-    numpy.ndarray: An array containing the simulated noise values.
+    int: The smallest product of 2, 3 and 5 (fast to transform) of at least 2n - 1.
+    """
+    length = 2 * n - 1
+    while True:
+        rest = length
+        for factor in (2, 3, 5):
+            while rest % factor == 0:
+                rest //= factor
+        if rest == 1:
+            return length
+        length += 1
+
+def pixel_fractions(n, sigma, length):
     """
-    noise = []
-    for _ in range(noise_vector_size):
-        # Generate random noise from Gaussian distribution with mean 0 and standard deviation sigma
-        electronics = round(np.random.normal(0, sigma))
+    Get the fraction of a Gaussian charge cloud collected by every pixel along one axis.
+
+    Parameters:
+    n (int): Number of pixels along the axis.
+    sigma (float): Standard deviation of the cloud in pixels.
+    length (int): Length of the Fourier transform, at least 2n - 1.
+
+    Returns:
+    numpy.ndarray: The fraction collected at offsets 0, 1, ..., n - 1 pixels from the pixel the charge
+    arrives at, followed by zeros and the offsets -(n - 1), ..., -1 (the wrap-around order of the transform).
+    """
+    scale = math.sqrt(2) * sigma
+    fractions = np.zeros(length)
+    for d in range(-(n - 1), n):
+        fractions[d] = (math.erf((d + 0.5) / scale) - math.erf((d - 0.5) / scale)) / 2
+    return fractions
+
+class Transport:
+    # Pixel parameters the drift depends on
+    PARAMETERS = ('life_time', 'e_val', 'diffusion_t', 'pix_size')
+
+    def __init__(self, drift_length, life_time=None, e_val=None, diffusion_t=None, pix_size=None,
+                 charge_loss=True, diffusion=True) -> None:
+        """
+        Initialize the drift of the ionization charge to the pixels, that can be used as the 'transport' of Input.three_d_array.
+
+        During its drift time the charge is attenuated by the electron life time, and its
+        transverse diffusion spreads it over the neighbouring pixels of a tile. Both effects are
+        applied to the whole (time, x, y) array at once, the diffusion as a convolution computed
+        with Fourier transforms so the cost grows as log of the tile size per pixel. Charge
+        spreading beyond the edge of a tile is lost.
+
+        The liquid argon parameters left to None are the ones of the pixels: the Pixel defaults,
+        or the pixel parameters of a simulation once bound to them (see bind).
+
+        Parameters:
+        drift_length (float): Drift distance of the charge to the readout plane in cm.
+        life_time (float): Electron life time in seconds.
+        e_val (float): Drift velocity in cm/s.
+        diffusion_t (float): Transverse diffusion in cm^2/s.
+        pix_size (float): Pixel size in cm.
+        charge_loss (bool): Attenuate the charge by the electron life time.
+        diffusion (bool): Share the charge between neighbouring pixels by transverse diffusion.
+        """
+        self.drift_length = drift_length
+        self.charge_loss = charge_loss
+        self.diffusion = diffusion
+
+        # Parameters given here, the others come from the pixel template
+        given = {'life_time': life_time, 'e_val': e_val, 'diffusion_t': diffusion_t, 'pix_size': pix_size}
+        self.given = {name: value for name, value in given.items() if value is not None}
+        template = Pixel.Pixel(id=None, **self.given)
+        for name in self.PARAMETERS:
+            setattr(self, name, getattr(template, name))
+
+        # Transfer functions of the diffusion, one per tile shape
+        self.transfers = {}
+
+    def bind(self, pixel_params):
+        """
+        Get the same drift with the liquid argon parameters of the pixels of a simulation.
+
+        Parameters:
+        pixel_params (dict): Pixel parameters of the simulation (e.g. life_time, e_val), as given to Tile.Tile.
 
-        # Probability of 100 attocoulombs leakage current (625 electrons per second)
-        leakage_probability = 625 / 1e8
+        Returns:
+        Transport: A Transport taking the parameters it was not given from pixel_params.
+        Raises:
+        Exception: If a parameter is given to both and the values differ.
+        """
+        for name, value in self.given.items():
+            if name in pixel_params and pixel_params[name] != value:
+                raise Exception("Transport has " + name + "=" + str(value) + " but the pixels have " + name + "=" + str(pixel_params[name]) + ".")
+        params = {name: pixel_params[name] for name in self.PARAMETERS if name in pixel_params}
+        params.update(self.given)
+        return Transport(self.drift_length, charge_loss=self.charge_loss, diffusion=self.diffusion, **params)
 
-        # Determine if there's a leakage current event
-        leakage_current = 1 if np.random.uniform() < leakage_probability else 0
+    @property
+    def drift_time(self) -> float:
+        """
+        Get the drift time of the charge.
 
-        noise.append(electronics + leakage_current)
+        Returns:
+        float: The drift length over the drift velocity, in seconds.
+        """
+        return self.drift_length / self.e_val
 
-    return np.array(noise)
+    @property
+    def attenuation(self) -> float:
+        """
+        Get the fraction of the charge surviving the drift.
 
-def ideal():
+        Returns:
+        float: exp(-drift time / life time), 1 without charge loss.
+        """
+        return math.exp(-self.drift_time / self.life_time) if self.charge_loss else 1.0
+
+    @property
+    def sigma(self) -> float:
+        """
+        Get the transverse spread of the charge at the readout plane.
+
+        Returns:
+        float: Standard deviation sqrt(2 D_t t) in pixels, 0 without diffusion.
+        """
+        return math.sqrt(2 * self.diffusion_t * self.drift_time) / self.pix_size if self.diffusion else 0.0
+
+    def transfer(self, x_dim, y_dim) -> np.ndarray:
+        """
+        Get the Fourier transform of the diffusion kernel of a tile, padded so the circular convolution does not wrap.
+
+        Parameters:
+        x_dim (int): Number of rows of pixels in a tile.
+        y_dim (int): Number of columns of pixels in a tile.
+
+        Returns:
+        numpy.ndarray: The transfer function, in the layout of numpy.fft.rfft2 over (fft_length(x_dim), fft_length(y_dim)).
+        """
+        if (x_dim, y_dim) not in self.transfers:
+            # The Gaussian kernel is separable, so its transform is the outer product of the transforms along x and y
+            x_fractions = pixel_fractions(x_dim, self.sigma, fft_length(x_dim))
+            y_fractions = pixel_fractions(y_dim, self.sigma, fft_length(y_dim))
+            self.transfers[x_dim, y_dim] = np.outer(np.fft.fft(x_fractions), np.fft.rfft(y_fractions))
+        return self.transfers[x_dim, y_dim]
+
+    def spread(self, grids) -> np.ndarray:
+        """
+        Apply the attenuation and the diffusion to charge arranged on the detector grid.
+
+        Parameters:
+        grids (numpy.ndarray): Charge values with the pixels of a tile along the last two axes, eg (time, x, y) or (time, tile, x, y).
+
+        Returns:
+        numpy.ndarray: The charge collected by every pixel, in the same shape.
+        """
+        grids = np.asarray(grids, dtype=float)
+        if self.sigma == 0:
+            return grids * self.attenuation
+
+        x_dim, y_dim = grids.shape[-2:]
+        size = (fft_length(x_dim), fft_length(y_dim))
+        transfer = self.transfer(x_dim, y_dim) * self.attenuation
+
+        # Convolve every grid with the kernel, a block of time steps at a time
+        flat = grids.reshape(-1, x_dim, y_dim)
+        spread = np.empty_like(flat)
+        for start in range(0, len(flat), TRANSPORT_BLOCK):
+            spectrum = np.fft.rfft2(flat[start:start + TRANSPORT_BLOCK], s=size)
+            spread[start:start + TRANSPORT_BLOCK] = np.fft.irfft2(spectrum * transfer, s=size)[:, :x_dim, :y_dim]
+        return spread.reshape(grids.shape)
+
+    def __call__(self, points_data, geometry):
+        """
+        Apply the attenuation and the diffusion to the pixel columns of the input data.
+
+        Parameters:
+        points_data (numpy.ndarray): 2D array (time, pixel columns) of charge values.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping of the detector.
+
+        Returns:
+        numpy.ndarray: A new 2D array with the charge collected by every pixel column.
+        """
+        transported = np.array(points_data, dtype=float)
+        transported[:, geometry.columns] = self.spread(points_data[:, geometry.columns])
+        return transported
+
+def ideal(noise_vector_size=None):
     """
     Returns an idealized noise value of 0 in an ideal environment.
 
+    Parameters:
+    noise_vector_size (int or tuple): Ignored, accepted so ideal can be used like the noise generators.
+
     Returns:
     int: Idealized noise value (always 0).
     """
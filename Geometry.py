@@ -0,0 +1,73 @@
+import numpy as np
+
+class Geometry:
+    def __init__(self, x_dim=8, y_dim=8, tiles=1, columns=None) -> None:
+        """
+        Initialize the geometry of a detector made of identical tiles of pixels.
+
+        Args:
+            x_dim (int): Number of rows of pixels in a tile.
+            y_dim (int): Number of columns of pixels in a tile.
+            tiles (int): Number of tiles in the detector.
+            columns (array-like): (tiles, x_dim, y_dim) array mapping every pixel to its column in the
+                input data (0 being the first pixel column, after the time stamps). By default the
+                columns of a tile are laid out along x first, one tile after the other, which is the
+                layout of Test.csv.
+        Raises:
+            Exception: If the pixel-to-column mapping does not match the tile dimensions.
+        """
+        self.x_dim = x_dim
+        self.y_dim = y_dim
+        self.tiles = tiles
+
+        if columns is None:
+            # Column of pixel (tile, x, y) is tile * x_dim * y_dim + y * x_dim + x
+            columns = np.arange(tiles * x_dim * y_dim).reshape(tiles, y_dim, x_dim).transpose(0, 2, 1)
+        columns = np.asarray(columns, dtype=int)
+        if columns.shape != (tiles, x_dim, y_dim):
+            raise Exception("Pixel-to-column mapping must have the dimension of the detector. Detector has dimension (" + str(tiles) + "," + str(x_dim) + "," + str(y_dim) + ") and mapping has dimension (" + ",".join(str(n) for n in columns.shape) + ").")
+        self.columns = columns
+
+    def __str__(self) -> str:
+        """
+        Get a string representation of the Geometry.
+
+        Returns:
+            str: The number of tiles and their dimension.
+        """
+        return "{} tile(s) of {}x{} pixels".format(self.tiles, self.x_dim, self.y_dim)
+
+    @property
+    def pixels(self) -> int:
+        """
+        Get the number of pixels in the detector.
+
+        Returns:
+            int: Number of pixels of all tiles.
+        """
+        return self.tiles * self.x_dim * self.y_dim
+
+    def tile(self, k):
+        """
+        Get the geometry of a single tile of the detector.
+
+        Args:
+            k (int): Index of the tile.
+
+        Returns:
+            Geometry: A one-tile Geometry mapping the pixels of tile k to their input columns.
+        """
+        return Geometry(self.x_dim, self.y_dim, 1, self.columns[k:k + 1])
+
+    def grid(self, points_data) -> np.ndarray:
+        """
+        Arrange the pixel columns of the input data on the detector grid.
+
+        Args:
+            points_data (np.ndarray): 2D array (time, pixel columns) of charge values.
+
+        Returns:
+            np.ndarray: A (time, x, y) array for a single tile, (time, tile, x, y) otherwise.
+        """
+        grids = points_data[:, self.columns]
+        return grids[:, 0] if self.tiles == 1 else grids
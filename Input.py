@@ -1,7 +1,39 @@
 import numpy as np
 import xarray as xr
-import csv
+import itertools
+import Instrument
+import Pixel
+import Geometry
 
+# Number of rows parsed at once when streaming a CSV file
+BLOCK_SIZE = 100000
+
+def read_blocks(path, block_size=BLOCK_SIZE):
+    """
+    Stream a CSV file as a sequence of NumPy 2D arrays of at most block_size rows.
+
+    The rows are parsed by NumPy's C parser one block at a time, so peak memory
+    depends on the block size and not on the length of the file.
+
+    Args:
+        path (str): Path to the CSV file.
+        block_size (int): Maximum number of rows (time stamps) per block.
+
+    Yields:
+        np.ndarray: A NumPy 2D array containing the next block of rows of the CSV file.
+    """
+    with open(path, 'r') as csvfile:
+        next(csvfile, None)  # Skip the header row
+        while True:
+            lines = list(itertools.islice(csvfile, block_size))
+            if not lines:
+                break
+            # Blank lines (eg trailing ones filling a whole block) hold no rows
+            rows = [line for line in lines if line.strip()]
+            if rows:
+                yield np.loadtxt(rows, delimiter=',', dtype=float, ndmin=2)
+
+@Instrument.timed('Input.file_to_2d')
 def file_to_2d(path):
     """
     Convert a CSV file to a NumPy 2D array.
@@ -12,63 +44,136 @@ def file_to_2d(path):
     Returns:
         np.ndarray: A NumPy 2D array containing the data from the CSV file.
     """
-    file_path = path
+    blocks = list(read_blocks(path))
+    if not blocks:
+        return np.array([], dtype=float)
+    return np.concatenate(blocks)
 
-    # Initialize an empty list to store the data rows
-    data_rows = []
 
-    # Read the CSV file and skip the header row
-    with open(file_path, 'r') as csvfile:
-        csvreader = csv.reader(csvfile)
-        header = next(csvreader)  # Skip the header row
-        for row in csvreader:
-            data_rows.append(row)
+def apply_environment(points_data, envir) -> np.ndarray:
+    """
+    Apply an environment factor to the pixel columns of the input data.
+
+    Args:
+        points_data (np.ndarray): 2D NumPy array (time, pixel columns) of charge values.
+        envir (callable): Function to apply an environment factor to the data. It is called once
+            with noise_vector_size=(time, pixels) and returns the noise in electrons. None applies nothing.
 
-    # Convert the data_rows list to a NumPy 2D array
-    np_array = np.array(data_rows, dtype=float)
+    Returns:
+        np.ndarray: A new 2D NumPy array with the noise added, in coulombs (points_data itself if envir is None).
+    """
+    if envir is None:
+        return points_data
+    return points_data + envir(noise_vector_size=points_data.shape) * Pixel.ELECTRON_CHARGE
 
-    return np_array
+def quantize(points_data, units=1, dtype=np.int64) -> np.ndarray:
+    """
+    Convert charge values in coulombs to integer counts of 1/units electron.
 
+    Args:
+        points_data (np.ndarray): Array of charge values in coulombs.
+        units (int): Number of fixed-point units per electron (1 counts whole electrons).
+        dtype (type): Integer type of the result, eg np.int32 to halve the memory of the input.
 
-def three_d_array(arr, envir) -> xr.DataArray:
+    Returns:
+        np.ndarray: The charge values rounded to the nearest unit.
+    Raises:
+        Exception: If a value does not fit in dtype.
+    """
+    counts = np.rint(np.asarray(points_data, dtype=float) * (units / Pixel.ELECTRON_CHARGE))
+    limits = np.iinfo(dtype)
+    if counts.size and (counts.min() < limits.min or counts.max() > limits.max):
+        raise Exception("Charge values do not fit in " + np.dtype(dtype).name + " with " + str(units) + " unit(s) per electron.")
+    return counts.astype(dtype)
+
+def check_dtype(units=None, dtype=None) -> None:
+    """
+    Make sure a storage type can hold the charge: integer counts when quantizing, float coulombs otherwise.
+
+    Args:
+        units (int): Number of fixed-point units per electron, None keeps coulombs.
+        dtype (type): Type the charge is stored as, None for the default.
+    Raises:
+        Exception: If dtype is an integer type without units (every charge in coulombs would round to 0)
+            or not an integer type with units.
+    """
+    if dtype is None:
+        return
+    integer = np.issubdtype(np.dtype(dtype), np.integer)
+    if units is None and integer:
+        raise Exception("Charge in coulombs cannot be stored as " + np.dtype(dtype).name + ", give units to store integer counts or use a float type.")
+    if units is not None and not integer:
+        raise Exception("Charge quantized with units=" + str(units) + " must be stored as an integer type, not " + np.dtype(dtype).name + ".")
+
+@Instrument.timed('Input.three_d_array')
+def three_d_array(arr, envir, geometry=None, units=None, dtype=None, transport=None) -> xr.DataArray:
     """
     Convert a 2D NumPy array to a 3D xarray.
 
     Args:
         arr (np.ndarray): 2D NumPy array containing coordinate data.
-        envir (callable): Function to apply an environment factor to the data.
+        envir (callable): Function to apply an environment factor to the data. It is called once
+            with noise_vector_size=(time, pixels) and returns the noise in electrons. None applies nothing.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping, a single 8x8 tile by default.
+        units (int): Quantize the charge to integer counts of 1/units electron (see quantize), None keeps coulombs.
+        dtype (type): Type the charge is stored as, eg np.float32, or np.int32 with units, to halve the memory
+            (np.int64 by default when quantizing, float otherwise).
+        transport (callable): Drift of the charge to the pixels (eg Environment.Transport), called as
+            transport(points_data, geometry) before the environment factor. None applies nothing.
 
     Returns:
-        xr.DataArray: A 3D xarray containing the data in a 8x8 grid over time.
+        xr.DataArray: A 3D xarray containing the data in a x by y grid over time,
+            or a 4D xarray (time, tile, x, y) for a geometry with several tiles.
+    Raises:
+        Exception: If dtype does not match units, see check_dtype.
     """
+    check_dtype(units, dtype)
+
     # Assuming your 2D NumPy array is named 'data'
     data = arr
+    geometry = Geometry.Geometry() if geometry is None else geometry
 
     # Extract the time stamps from the first column of the data
     time_stamps = data[:, 0]
 
-    # Initialize an empty list to store the 8x8 grids
-    points_grids = []
+    # Attenuate and diffuse the charge on its way to the pixels
+    points_data = data[:, 1:] if transport is None else transport(data[:, 1:], geometry)
 
-    # Loop through each row to create the 8x8 grid for each timestamp
-    for row in data:
-        # Apply environment factor
-        row[1:] + envir()
+    # Apply environment factor to the coordinate data (remaining columns) of every timestamp at once
+    points_data = apply_environment(points_data, envir)
 
-        # Extract the coordinate data (remaining 64 columns) for the current timestamp
-        points_data = row[1:].reshape(8, 8).transpose()
+    # Quantize the charge once here so the Tile only does exact integer arithmetic, or store it in a compact type
+    if units is not None:
+        points_data = quantize(points_data, units, np.int64 if dtype is None else dtype)
+    elif dtype is not None:
+        points_data = points_data.astype(dtype)
 
-        # Append the current grid to the list of grids
-        points_grids.append(points_data)
+    # Create the x by y grid of every tile for each timestamp
+    points_grids = geometry.grid(points_data)
 
-    # Convert the list of grids into a 3D NumPy array
-    points_grids = np.array(points_grids)
-
-    # Create the x, y coordinates for the 8x8 grid
-    x_coords = np.arange(8)
-    y_coords = np.arange(8)
+    # Create the x, y coordinates for the grid
+    x_coords = np.arange(geometry.x_dim)
+    y_coords = np.arange(geometry.y_dim)
 
     # Create the xarray with the given dimensions and data
-    xarray_3d = xr.DataArray(points_grids, dims=('time', 'x', 'y'), coords={'time': time_stamps, 'x': x_coords, 'y': y_coords})
+    if geometry.tiles == 1:
+        return xr.DataArray(points_grids, dims=('time', 'x', 'y'), coords={'time': time_stamps, 'x': x_coords, 'y': y_coords})
+    return xr.DataArray(points_grids, dims=('time', 'tile', 'x', 'y'), coords={'time': time_stamps, 'tile': np.arange(geometry.tiles), 'x': x_coords, 'y': y_coords})
+
+def three_d_blocks(blocks, envir, geometry=None, units=None, dtype=None, transport=None):
+    """
+    Convert a sequence of 2D NumPy arrays to a sequence of 3D xarrays.
 
-    return xarray_3d
\ No newline at end of file
+    Args:
+        blocks (iterable): 2D NumPy arrays containing coordinate data, eg from read_blocks.
+        envir (callable): Function to apply an environment factor to the data.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping, a single 8x8 tile by default.
+        units (int): Quantize the charge to integer counts of 1/units electron, None keeps coulombs.
+        dtype (type): Type the charge is stored as, see three_d_array.
+        transport (callable): Drift of the charge to the pixels, see three_d_array.
+
+    Yields:
+        xr.DataArray: A 3D xarray for each block.
+    """
+    for block in blocks:
+        yield three_d_array(block, envir, geometry, units, dtype, transport)
@@ -0,0 +1,208 @@
+import numpy as np
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import time as clock
+import tracemalloc
+
+# Whether instrumentation is collected, checked before any other work so disabled runs pay (almost) nothing
+ENABLED = False
+
+# Number of functions and allocation sites listed in the report
+TOP = 20
+
+# Collected measurements: stage -> [calls, seconds], counter -> value, counter -> per-pixel array
+timers = {}
+counters = {}
+pixel_counters = {}
+
+# Optional cProfile profiler, and the time the instrumentation was enabled
+profiler = None
+started = None
+
+def enable(profile=False, trace_memory=False) -> None:
+    """
+    Start collecting stage timers and counters, dropping anything collected before.
+
+    Parameters:
+        profile (bool): Also run cProfile over the whole run.
+        trace_memory (bool): Also trace memory allocations with tracemalloc.
+    """
+    global ENABLED, profiler, started
+    timers.clear()
+    counters.clear()
+    pixel_counters.clear()
+    ENABLED = True
+    started = clock.perf_counter()
+    if trace_memory:
+        tracemalloc.start()
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+def disable() -> None:
+    """
+    Stop collecting, the measurements are kept for the report.
+    """
+    global ENABLED
+    ENABLED = False
+    if profiler is not None:
+        profiler.disable()
+
+def start() -> float:
+    """
+    Get the start time of a timed section.
+
+    Returns:
+        float: The current time, 0 when instrumentation is disabled.
+    """
+    return clock.perf_counter() if ENABLED else 0.0
+
+def stop(stage, begin) -> None:
+    """
+    Add the time elapsed since start() to a stage timer.
+
+    Parameters:
+        stage (str): Name of the stage.
+        begin (float): Value returned by start().
+    """
+    if ENABLED:
+        timer = timers.setdefault(stage, [0, 0.0])
+        timer[0] += 1
+        timer[1] += clock.perf_counter() - begin
+
+def timed(stage):
+    """
+    Decorate a function so every call is added to a stage timer.
+
+    Parameters:
+        stage (str): Name of the stage.
+
+    Returns:
+        callable: The decorator.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+            begin = clock.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stop(stage, begin)
+        return wrapper
+    return decorator
+
+def count(counter, n=1) -> None:
+    """
+    Add to a counter. Callers on hot paths check ENABLED first.
+
+    Parameters:
+        counter (str): Name of the counter.
+        n (int): Amount to add.
+    """
+    counters[counter] = counters.get(counter, 0) + int(n)
+
+def count_pixels(counter, hits) -> None:
+    """
+    Add to a per-pixel counter. Callers on hot paths check ENABLED first.
+
+    Parameters:
+        counter (str): Name of the counter.
+        hits (np.ndarray): Amount to add for every pixel (eg a boolean mask of the pixels that reset).
+    """
+    total = pixel_counters.get(counter)
+    if total is None or total.shape != np.shape(hits):
+        total = pixel_counters[counter] = np.zeros(np.shape(hits), dtype=np.int64)
+    total += hits
+
+def report() -> dict:
+    """
+    Build the structured report of everything collected so far.
+
+    Returns:
+        dict: Wall time, stage timers, counters, per-pixel counters and, if enabled, the top
+            cProfile functions and tracemalloc allocation sites.
+    """
+    result = {
+        'wall_seconds': None if started is None else clock.perf_counter() - started,
+        'stages': {stage: {'calls': calls, 'seconds': seconds} for stage, (calls, seconds) in sorted(timers.items(), key=lambda item: -item[1][1])},
+        'counters': dict(counters),
+        'pixel_counters': {name: total.tolist() for name, total in pixel_counters.items()},
+    }
+
+    if profiler is not None:
+        stats = pstats.Stats(profiler)
+        rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:TOP]
+        result['profile'] = [{'function': "{}:{}({})".format(*key), 'calls': calls, 'total_seconds': total, 'cumulative_seconds': cumulative}
+                             for key, (primitive, calls, total, cumulative, callers) in rows]
+
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        result['memory'] = {
+            'current_mb': current / 2**20,
+            'peak_mb': peak / 2**20,
+            'top': [{'site': str(stat.traceback), 'mb': stat.size / 2**20, 'count': stat.count}
+                    for stat in tracemalloc.take_snapshot().statistics('lineno')[:TOP]],
+        }
+    return result
+
+def summary(result=None) -> str:
+    """
+    Format a report as a human-readable summary.
+
+    Parameters:
+        result (dict): Report as returned by report(), a new one by default.
+
+    Returns:
+        str: The summary.
+    """
+    result = report() if result is None else result
+    out = io.StringIO()
+    out.write("*******************************************************\n")
+    out.write("Run profile\n")
+    out.write("*******************************************************\n")
+    if result['wall_seconds'] is not None:
+        out.write("Wall time                  = {:.3f} [s]\n".format(result['wall_seconds']))
+    for stage, timer in result['stages'].items():
+        out.write("{:<26} = {:.3f} [s] in {} call(s)\n".format(stage, timer['seconds'], timer['calls']))
+    out.write("*******************************************************\n")
+    for counter, value in result['counters'].items():
+        out.write("{:<26} = {}\n".format(counter, value))
+    for name, total in result['pixel_counters'].items():
+        total = np.asarray(total)
+        out.write("{:<26} = {} total, {} min, {} max per pixel\n".format(name, total.sum(), total.min(), total.max()))
+    if 'profile' in result:
+        out.write("*******************************************************\n")
+        out.write("Top functions by cumulative time\n")
+        for row in result['profile']:
+            out.write("{:>10.3f} [s] {:>10} calls  {}\n".format(row['cumulative_seconds'], row['calls'], row['function']))
+    if 'memory' in result:
+        out.write("*******************************************************\n")
+        out.write("Traced memory peak         = {:.1f} [MiB]\n".format(result['memory']['peak_mb']))
+        for row in result['memory']['top']:
+            out.write("{:>10.1f} [MiB]  {}\n".format(row['mb'], row['site']))
+    out.write("*******************************************************\n")
+    return out.getvalue()
+
+def write_report(path) -> str:
+    """
+    Write the report as JSON, and its human-readable summary next to it (same name, .txt extension).
+
+    Parameters:
+        path (str): Path to the JSON file.
+
+    Returns:
+        str: Path to the JSON file.
+    """
+    path = os.path.expanduser(path)
+    result = report()
+    with open(path, 'w') as file:
+        json.dump(result, file, indent=2)
+    with open(os.path.splitext(path)[0] + '.txt', 'w') as file:
+        file.write(summary(result))
+    return path
@@ -1,175 +1,582 @@
 import numpy as np
 import xarray as xr
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from mpl_toolkits.mplot3d import Axes3D
-import matplotlib.colors as mcolors
-from decimal import Decimal
 import os
-import h5netcdf
+import Geometry
+import Instrument
+
+# Number of reset events the event log grows by at least when it is full
+EVENT_CHUNK = 4096
+
+# Columns of the reset event log and their types
+EVENT_COLUMNS = {'frame': np.int64, 'tile': np.int32, 'x': np.int32, 'y': np.int32, 'current': float}
+
+# Most resets plot_coordinates_over_time draws one by one before it switches to a binned density
+POINT_BUDGET = 100000
+
+def new_figure(offscreen=False):
+    """
+    Create a figure to draw on.
+
+    Parameters:
+    - offscreen (bool): Draw without pyplot, so no display backend or GUI is ever touched.
+
+    Returns:
+    - matplotlib.figure.Figure: The new figure.
+    """
+    if offscreen:
+        from matplotlib.figure import Figure
+        return Figure()
+    import matplotlib.pyplot as plt
+    return plt.figure()
+
+def animate(fig, update, frames, count, filename=None, fps=10, interval=100, blit=False):
+    """
+    Show an animation on screen, or render it offscreen to a video or a sequence of images.
+
+    Parameters:
+    - fig (matplotlib.figure.Figure): Figure to animate.
+    - update (callable): Called with every item of frames, returns the artists it changed.
+    - frames (iterable): Data of every frame, produced one at a time.
+    - count (int): Number of frames.
+    - filename (str): A video (.gif, or .mp4 and the like with ffmpeg) or a pattern such as 'frames/{:05d}.png' for
+      one image per frame, None shows the animation instead.
+    - fps (int): Frames per second of a video.
+    - interval (int): Delay between frames in milliseconds on screen.
+    - blit (bool): Only redraw the artists returned by update (they have to be created with animated=True).
+
+    Returns:
+    - str: The filename the animation was rendered to, None when it was shown.
+    """
+    from matplotlib import animation
+
+    if filename is None:
+        import matplotlib.pyplot as plt
+        ani = animation.FuncAnimation(fig, update, frames=frames, interval=interval, blit=blit, save_count=count, cache_frame_data=False)
+        plt.show()
+        return None
+
+    filename = os.path.expanduser(filename)
+    sequence = '{' in filename
+    if not sequence and os.path.splitext(filename)[1].lower() != '.gif':
+        if not animation.writers.is_available('ffmpeg'):
+            raise Exception("Rendering " + filename + " requires ffmpeg, use a .gif or an image pattern such as 'frames/{:05d}.png' instead.")
+        ani = animation.FuncAnimation(fig, update, frames=frames, blit=False, save_count=count, cache_frame_data=False)
+        ani.save(filename, writer=animation.FFMpegWriter(fps=fps))
+        return filename
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from PIL import Image
+
+    # Draw everything but the animated artists once, then only restore that background and draw them on every frame
+    canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    background = canvas.copy_from_bbox(fig.bbox)
+
+    images = []
+    for i, item in enumerate(frames):
+        if blit:
+            canvas.restore_region(background)
+            for artist in update(item):
+                artist.axes.draw_artist(artist)
+        else:
+            update(item)
+            canvas.draw()
+        image = Image.fromarray(np.asarray(canvas.buffer_rgba())).convert('RGB')
+        if sequence:
+            image.save(filename.format(i))
+        else:
+            images.append(image)
+
+    if images:
+        images[0].save(filename, save_all=True, append_images=images[1:], duration=1000 / fps, loop=0)
+    return filename
 
 class Output:
     
-    def __init__(self, time):
+    def __init__(self, time, geometry=None, writer=None, keep=True, statistics=None):
         """
         Initialize the Output class.
 
         Parameters:
         - time (array-like): Array containing time stamps.
+        - geometry (Geometry): Tile dimensions of the detector, a single 8x8 tile by default.
+        - writer (Writer.EventWriter): Writer the reset events and time stamps are streamed to as they are recorded.
+        - keep (bool): Also keep the reset events in memory. With a writer, False bounds the memory of long runs
+          (the dense xarray is then empty, read the file back with Writer.open_output instead).
+        - statistics (Statistics.Statistics): Online accumulators updated with every reset as it is recorded,
+          kept in memory or not.
+
+        This constructor initializes the Output class with time stamps and an empty reset event log.
+        Resets are rare, so they are stored as columns (frame index, tile, x, y, instantaneous current)
+        that grow in chunks, and the 3D xarray of frames ('arr') is only built when it is needed.
+        """
+        self.geometry = Geometry.Geometry() if geometry is None else geometry
+        self.time = np.asarray(time)
+        self.writer = writer
+        self.keep = keep
+        self.statistics = statistics
+        if self.writer is not None:
+            self.writer.extend_time(self.time)
+        if self.statistics is not None:
+            self.statistics.extend(self.time)
+
+        # Columnar reset event log, the first 'count' rows are in use
+        self.columns = {name: np.empty(EVENT_CHUNK, dtype=dtype) for name, dtype in EVENT_COLUMNS.items()}
+        self.count = 0
+
+        # Dense xarray built from the event log, dropped whenever the log changes
+        self.dense = None
+
+    @property
+    def arr(self):
+        """
+        Get the dense xarray of instantaneous current frames.
 
-        This constructor initializes the Output class with time stamps and creates a 3D xarray to store data.
+        Returns:
+        - xr.DataArray: (time, x, y) frames, or (time, tile, x, y) when the detector has several tiles.
         """
-        x_coords = np.zeros(8)  # Initialize 'x' coordinates with 0
-        y_coords = np.zeros(8)  # Initialize 'y' coordinates with 0
+        if self.dense is None:
+            self.dense = self.to_xarray()
+        return self.dense
 
-        # Create an empty 3D array filled with NaN values
-        data = np.empty((len(time), len(x_coords), len(y_coords)), dtype = float)
-        data[:] = np.nan
+    def events(self):
+        """
+        Get the reset event log.
 
-        # Create the 3D xarray with the given dimensions and coordinates
-        xarray_3d = xr.DataArray(data, dims=('time', 'x', 'y'), coords={'time': time, 'x': x_coords, 'y': y_coords})
+        Returns:
+        - dict: One array per column of EVENT_COLUMNS, one row per reset in the order they were recorded.
+        """
+        return {name: column[:self.count] for name, column in self.columns.items()}
 
-        self.arr = xarray_3d
+    def add_events(self, frame, x, y, current, tile=0):
+        """
+        Append reset events to the event log.
+
+        Parameters:
+        - frame (array-like): Frame index of each reset.
+        - x (array-like): Row of the pixel of each reset.
+        - y (array-like): Column of the pixel of each reset.
+        - current (array-like): Instantaneous current of each reset.
+        - tile (array-like): Tile of the pixel of each reset.
 
+        This method grows the event log by at least EVENT_CHUNK rows (doubling it) when it is full.
+        """
+        if self.writer is not None:
+            self.writer.append(frame, x, y, current, tile)
+        if self.statistics is not None:
+            self.statistics.add(x, y, current, tile)
+        if not self.keep:
+            return
+
+        current = np.atleast_1d(current)
+        n = len(current)
+        if Instrument.ENABLED:
+            Instrument.count('events_recorded', n)
+        if self.count + n > len(self.columns['current']):
+            capacity = max(2 * len(self.columns['current']), self.count + n, EVENT_CHUNK)
+            for name, column in self.columns.items():
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:self.count] = column[:self.count]
+                self.columns[name] = grown
+
+        for name, values in zip(('frame', 'tile', 'x', 'y', 'current'), (frame, tile, x, y, current)):
+            self.columns[name][self.count:self.count + n] = values
+        self.count += n
+        self.dense = None
+
+    @Instrument.timed('Output.set_frame')
     def set_frame(self, t, arr):
         """
         Set a frame of the 3D xarray with the given array data.
 
         Parameters:
         - t (int): Frame index.
-        - arr (array-like): Data to be stored in the frame.
+        - arr (array-like): Data to be stored in the frame, (x, y) or (tile, x, y) for several tiles.
 
-        This method sets the data for a specific frame in the 3D xarray.
+        This method records the non-zero entries (the resets) of the frame in the event log.
         """
-        self.arr[t] = arr
-    
-    def time_lapse(self):
+        values = np.asarray(arr, dtype=float)
+        if values.ndim == 2:
+            values = values[np.newaxis]
+        tile, x, y = np.nonzero((values != 0) & ~np.isnan(values))
+        self.add_events(t, x, y, values[tile, x, y], tile)
+        if Instrument.ENABLED:
+            Instrument.count('frames_written')
+
+    def state(self):
+        """
+        Get a copy of the frame time stamps and of the event log, eg to checkpoint a long run.
+
+        Returns:
+        - dict: The 'time' stamps and one array per column of EVENT_COLUMNS (no events if they are not kept in memory).
+        """
+        state = {name: column[:self.count].copy() for name, column in self.columns.items()}
+        state['time'] = self.time.copy()
+        return state
+
+    def set_state(self, state):
+        """
+        Restore the frame time stamps and the event log from a copy made by state.
+
+        Parameters:
+        - state (dict): The 'time' stamps and one array per column of EVENT_COLUMNS.
+
+        A writer that already holds frames (a resumed file) is left as it is, an empty writer
+        (eg a run forked from a checkpoint into a new file) gets the restored frames and events too.
+        The statistics are left as they are, they are restored on their own (see Statistics.set_state).
+        """
+        self.time = np.empty(0)
+        self.count = 0
+        self.dense = None
+
+        # A resumed writer already holds these frames and events, only an empty one is sent them,
+        # and the statistics already count these events
+        writer, statistics = self.writer, self.statistics
+        if writer is not None and writer.position()['time']:
+            self.writer = None
+        self.statistics = None
+        try:
+            self.extend(state['time'])
+            self.add_events(state['frame'], state['x'], state['y'], state['current'], state['tile'])
+        finally:
+            self.writer, self.statistics = writer, statistics
+
+    def set_tile(self, k, frames):
+        """
+        Set every frame of one tile of the detector.
+
+        Parameters:
+        - k (int): Tile index.
+        - frames (array-like): (time, x, y) data of the tile.
+
+        This method merges the result of a tile simulated on its own into the detector output.
+        """
+        values = np.asarray(frames, dtype=float)
+        frame, x, y = np.nonzero((values != 0) & ~np.isnan(values))
+        self.add_events(frame, x, y, values[frame, x, y], k)
+
+    def merge(self, other, tile=0):
+        """
+        Append the reset events of another Output.
+
+        Parameters:
+        - other (Output): Output of a tile simulated on its own (or of a group of tiles).
+        - tile (int): Index of the first tile of 'other' in this detector.
+        """
+        events = other.events()
+        self.add_events(events['frame'], events['x'], events['y'], events['current'], events['tile'] + tile)
+
+    def extend(self, time):
+        """
+        Append empty frames for new time stamps.
+
+        Parameters:
+        - time (array-like): Array containing the new time stamps.
+
+        This method grows the output when the simulation consumes its input block by block.
+        """
+        self.time = np.concatenate((self.time, time))
+        self.dense = None
+        if self.writer is not None:
+            self.writer.extend_time(time)
+        if self.statistics is not None:
+            self.statistics.extend(time)
+
+    def clear(self, frames=slice(None)):
+        """
+        Set frames to zero (no replenish at those time steps).
+
+        Parameters:
+        - frames (slice): Frame indices to clear, all frames by default.
+
+        Events already streamed to a writer or added to the statistics are not affected.
+        """
+        start, stop, step = frames.indices(len(self.time))
+        frame = self.columns['frame'][:self.count]
+        keep = (frame < start) | (frame >= stop)
+        if keep.all():
+            return
+
+        n = int(keep.sum())
+        for name, column in self.columns.items():
+            column[:n] = column[:self.count][keep]
+        self.count = n
+        self.dense = None
+
+    def window(self, time_start=None, time_stop=None):
+        """
+        Find the frames of a time window.
+
+        Parameters:
+        - time_start (float): First time stamp of the window, from the beginning by default.
+        - time_stop (float): Time stamp the window ends before, up to the end by default.
+
+        Returns:
+        - tuple: Index of the first frame of the window and index after its last frame.
+        """
+        first = 0 if time_start is None else int(np.searchsorted(self.time, time_start, side='left'))
+        last = len(self.time) if time_stop is None else int(np.searchsorted(self.time, time_stop, side='left'))
+        return first, max(first, last)
+
+    def to_xarray(self, time_start=None, time_stop=None):
+        """
+        Build the dense xarray of instantaneous current frames, optionally for a time window only.
+
+        Parameters:
+        - time_start (float): First time stamp of the window, from the beginning by default.
+        - time_stop (float): Time stamp the window ends before, up to the end by default.
+
+        Returns:
+        - xr.DataArray: (time, x, y) frames, or (time, tile, x, y) when the detector has several tiles.
+        """
+        first, last = self.window(time_start, time_stop)
+
+        geometry = self.geometry
+        data = np.zeros((last - first, geometry.tiles, geometry.x_dim, geometry.y_dim))
+
+        # Scatter the resets of the window into the frames
+        events = self.events()
+        selected = (events['frame'] >= first) & (events['frame'] < last)
+        data[events['frame'][selected] - first, events['tile'][selected], events['x'][selected], events['y'][selected]] = events['current'][selected]
+
+        x_coords = np.arange(geometry.x_dim)
+        y_coords = np.arange(geometry.y_dim)
+        time = self.time[first:last]
+        if geometry.tiles == 1:
+            return xr.DataArray(data[:, 0], dims=('time', 'x', 'y'), coords={'time': time, 'x': x_coords, 'y': y_coords})
+        return xr.DataArray(data, dims=('time', 'tile', 'x', 'y'), coords={'time': time, 'tile': np.arange(geometry.tiles), 'x': x_coords, 'y': y_coords})
+
+    def select_frames(self, step=1, time_start=None, time_stop=None, max_frames=None):
+        """
+        Pick the frames to render, eg to review a long run in a predictable time.
+
+        Parameters:
+        - step (int): Render every step-th frame.
+        - time_start (float): First time stamp of the window, from the beginning by default.
+        - time_stop (float): Time stamp the window ends before, up to the end by default.
+        - max_frames (int): Increase the step so that at most this many frames are rendered.
+
+        Returns:
+        - np.ndarray: Indices of the selected frames.
+        """
+        first, last = self.window(time_start, time_stop)
+        if max_frames:
+            step = max(step, -(-(last - first) // max_frames))
+        return np.arange(first, last, step)
+
+    def frame_grids(self, frames, tile=0):
+        """
+        Build the instantaneous current of selected frames one at a time, straight from the event log.
+
+        Parameters:
+        - frames (array-like): Indices of the frames, in increasing order.
+        - tile (int): Tile of the detector to show.
+
+        Yields:
+        - tuple: The frame index and its (x, y) array of instantaneous currents.
+        """
+        events = self.events()
+        mine = events['tile'] == tile
+        order = np.argsort(events['frame'][mine], kind='stable')
+        frame = events['frame'][mine][order]
+        x, y, current = (events[name][mine][order] for name in ('x', 'y', 'current'))
+
+        # Each frame's resets are a contiguous run of the sorted log
+        bounds = np.searchsorted(frame, np.stack((frames, np.asarray(frames) + 1)))
+        grid = np.zeros((self.geometry.x_dim, self.geometry.y_dim))
+        for index, lo, hi in zip(frames, bounds[0], bounds[1]):
+            grid[:] = 0
+            grid[x[lo:hi], y[lo:hi]] = current[lo:hi]
+            yield int(index), grid
+
+    def time_lapse(self, step=1, time_start=None, time_stop=None, max_frames=None, tile=0, filename=None, fps=10, interval=100, vmax=None):
         """
         Create an animation to visualize the 3D xarray over time using imshow.
 
+        Parameters:
+        - step, time_start, time_stop, max_frames: Frames to render, see select_frames.
+        - tile (int): Tile of the detector to show.
+        - filename (str): Render offscreen to a video (.mp4 and the like with ffmpeg, .gif) or to a sequence of
+          images (a pattern such as 'frames/{:05d}.png') instead of showing the animation.
+        - fps (int): Frames per second of a video.
+        - interval (int): Delay between frames on screen in milliseconds.
+        - vmax (float): Instantaneous current at the top of the color scale, None rescales every frame to its own data.
+
+        Returns:
+        - str: The filename the animation was rendered to, None when it was shown.
+
         This method generates an animation that shows the 3D xarray's data changing over time using imshow.
+        A single image is created and only its data is replaced on every frame. With a fixed vmax only the
+        image is redrawn (blitting), a rescaled frame redraws the whole figure so the color bar follows it.
         """
-        # Create a figure and axes for the animation
-        fig, ax = plt.subplots()
+        fig = new_figure(offscreen=filename is not None)
+        ax = fig.add_subplot(111)
 
-        # Create an initial empty plot
-        img = ax.imshow(np.zeros_like(self.arr[0]), cmap='viridis', origin='lower', extent=[0, 1, 0, 1], vmin = 0, vmax = 1e-11)
+        # Create the image once, every frame only replaces its data (the color bar only changes when rescaling)
+        blit = vmax is not None
+        img = ax.imshow(np.zeros((self.geometry.x_dim, self.geometry.y_dim)), cmap='viridis', origin='lower', vmin=0, vmax=1e-11 if vmax is None else vmax, animated=blit)
+        label = ax.text(0.02, 0.95, '', transform=ax.transAxes, color='white', animated=blit)
+        ax.set_xlabel('X')
+        ax.set_ylabel('Y')
 
         # Create a color bar for the plot
-        cbar = plt.colorbar(img, fraction=0.046, pad=0.04)
+        cbar = fig.colorbar(img, fraction=0.046, pad=0.04)
         cbar.set_label('Instantaneous Current')
-        
-        def update(frame):
-            plt.cla()  # Clear the current plot
-
-            # Extract the data for the current time step
-            grid_data = self.arr[frame].values
-
-            # Plot the 2D chess grid for the current time step
-            img = plt.imshow(grid_data, cmap='viridis', origin='lower', vmin = 0, vmax = 1e-11)
-            img.autoscale()
-
-            # Customize the plot as needed
-            plt.title(f'Tile Time Step: {frame}')
-            plt.xlabel('X')
-            plt.ylabel('Y')
-        
-        # Create the animation
-        ani = FuncAnimation(fig, update, frames=np.arange(len(self.arr['time'])), interval=100)
-        plt.show()
 
-    def time_lapse_histogram(self):
+        def update(item):
+            frame, grid_data = item
+            img.set_data(grid_data)
+            if vmax is None:
+                img.autoscale()
+            label.set_text(f'Tile Time Step: {frame}')
+            return img, label
+
+        frames = self.select_frames(step, time_start, time_stop, max_frames)
+        return animate(fig, update, self.frame_grids(frames, tile), len(frames), filename, fps, interval, blit=blit)
+
+    def time_lapse_histogram(self, step=1, time_start=None, time_stop=None, max_frames=None, tile=0, filename=None, fps=10, interval=100, zmax=1e-14):
         """
         Create an animation to visualize the 3D xarray data over time using a 3D surface plot.
 
+        Parameters:
+        - step, time_start, time_stop, max_frames: Frames to render, see select_frames.
+        - tile (int): Tile of the detector to show.
+        - filename (str): Render offscreen to a video or a sequence of images instead of showing it, see time_lapse.
+        - fps (int): Frames per second of a video.
+        - interval (int): Delay between frames on screen in milliseconds.
+        - zmax (float): Instantaneous current at the top of the z axis.
+
+        Returns:
+        - str: The filename the animation was rendered to, None when it was shown.
+
         This method generates an animation that shows the 3D xarray's data changing over time using a 3D surface plot.
+        The axes and the coordinate grid are set up once, every frame only replaces the surface.
         """
-        # Create a figure and axes for the animation
-        fig = plt.figure()
+        # Registers the 3D projection
+        from mpl_toolkits.mplot3d import Axes3D
+
+        fig = new_figure(offscreen=filename is not None)
         ax = fig.add_subplot(111, projection='3d')
-        plot = None
-        # Function to update the 3D plot for each animation frame
-        def update(frame):
-            plt.cla()  # Clear the current plot
+        ax.set_xlabel('X')
+        ax.set_ylabel('Y')
+        ax.set_zlabel('Instantaneous Current')
+        ax.set_zlim(0, zmax)
 
-            # Extract the data for the current time step
-            data_at_time = self.arr[frame].values
+        # Create the meshgrid for the x and y coordinates once
+        X, Y = np.meshgrid(np.arange(self.geometry.x_dim), np.arange(self.geometry.y_dim), indexing='ij')
+        surface = []
 
-            # Create a meshgrid for the x and y coordinates
-            X, Y = np.meshgrid(np.arange(len(self.arr['x'])), np.arange(len(self.arr['y'])))
+        # Function to update the 3D plot for each animation frame
+        def update(item):
+            frame, data_at_time = item
+            if surface:
+                surface.pop().remove()
+            surface.append(ax.plot_surface(X, Y, data_at_time, cmap='viridis', rstride=1, cstride=1))
+            ax.set_title(f'Time step: {frame}')
+            return surface
 
-            # Plot the 3D surface for the current time step
-            plot = ax.plot_surface(X, Y, data_at_time, cmap='viridis', rstride=1, cstride=1)
+        frames = self.select_frames(step, time_start, time_stop, max_frames)
+        return animate(fig, update, self.frame_grids(frames, tile), len(frames), filename, fps, interval, blit=False)
 
-            # Customize the plot as needed
-            ax.set_title(f'Time step: {frame}')
-            ax.set_xlabel('X')
-            ax.set_ylabel('Y')
-            ax.set_zlabel('Instantaneous Current')
-            ax.set_zlim(0, 1e-14)
+    def event_points(self, threshold=0, time_start=None, time_stop=None, tile=0):
+        """
+        Get the above-threshold resets of a time window straight from the event log.
 
-        # Create the animation
-        ani = FuncAnimation(fig, update, frames=np.arange(len(self.arr['time'])), interval=100) #this should be the last line before the plt.show()
-        plt.show()
+        Parameters:
+        - threshold (float): Only keep resets with an instantaneous current above this value.
+        - time_start (float): First time stamp of the window, from the beginning by default.
+        - time_stop (float): Time stamp the window ends before, up to the end by default.
+        - tile (int): Tile of the detector, None keeps every tile.
 
-    def plot_coordinates_over_time(self, threshold):
+        Returns:
+        - dict: 'time', 'x', 'y', 'tile' and 'current' arrays, one entry per reset.
+        """
+        first, last = self.window(time_start, time_stop)
+        events = self.events()
+        selected = (events['current'] > threshold) & (events['frame'] >= first) & (events['frame'] < last)
+        if tile is not None:
+            selected &= events['tile'] == tile
+        points = {name: events[name][selected] for name in ('x', 'y', 'tile', 'current')}
+        points['time'] = self.time[events['frame'][selected]]
+        return points
+
+    def plot_coordinates_over_time(self, threshold, time_start=None, time_stop=None, max_points=POINT_BUDGET, time_bins=200, tile=0, filename=None):
         """
         Create a scatter plot of coordinates over time.
 
         Parameters:
         - threshold (float): Threshold value for non-zero data points.
+        - time_start (float): First time stamp to show, from the beginning by default (zoom in with a time window).
+        - time_stop (float): Time stamp to show up to (excluded), up to the end by default.
+        - max_points (int): Most resets drawn one by one, above it the resets are binned and their density is drawn.
+        - time_bins (int): Number of time bins of the density.
+        - tile (int): Tile of the detector to show.
+        - filename (str): Save the plot to this image file offscreen instead of showing it.
+
+        Returns:
+        - str: The filename the plot was saved to, None when it was shown.
 
         This method generates a scatter plot showing the coordinates changing over time for above threshold data points.
+        The points come straight from the reset event log, so the cost follows the number of resets rather
+        than the size of the output.
         """
+        # Registers the 3D projection
+        from mpl_toolkits.mplot3d import Axes3D
+
         # Create a 3D scatter plot with time as one axis, and x and y as the other two axes
-        fig = plt.figure()
+        fig = new_figure(offscreen=filename is not None)
         ax = fig.add_subplot(111, projection='3d')
-
-        # Extract the meshgrid for time, x, and y
-        T, X, Y = np.meshgrid(self.arr['time'], np.arange(len(self.arr['x'])), np.arange(len(self.arr['y'])), indexing='ij')
-
-        # Reshape the data to 1D arrays
-        T_1d = T.ravel()
-        X_1d = X.ravel()
-        Y_1d = Y.ravel()
-        data_1d = self.arr.values.ravel()
-
-        # Filter data points above the threshold
-        nonzero_mask = np.where(data_1d > threshold)[0]
-        T_1d_nonzero = T_1d[nonzero_mask]
-        X_1d_nonzero = X_1d[nonzero_mask]
-        Y_1d_nonzero = Y_1d[nonzero_mask]
-        data_1d_nonzero = data_1d[nonzero_mask]
-
-        # Plot the 3D scatter plot for above threshold data points
-        sc_nonzero = ax.scatter(T_1d_nonzero, X_1d_nonzero, Y_1d_nonzero, c=data_1d_nonzero, cmap='viridis', marker='o')
+        points = self.event_points(threshold, time_start, time_stop, tile)
+
+        if len(points['time']) <= max_points:
+            # Plot the 3D scatter plot for above threshold data points
+            sc_nonzero = ax.scatter(points['time'], points['x'], points['y'], c=points['current'], cmap='viridis', marker='o')
+            ax.set_title('X and Y over Time (Scatter Plot)')
+            fig.colorbar(sc_nonzero)
+        else:
+            # Too many resets to draw one by one, count them in (time, x, y) bins and draw the occupied bins
+            edges = (np.linspace(points['time'].min(), points['time'].max(), time_bins + 1),
+                     np.arange(self.geometry.x_dim + 1) - 0.5, np.arange(self.geometry.y_dim + 1) - 0.5)
+            counts, _ = np.histogramdd((points['time'], points['x'], points['y']), bins=edges)
+            t, x, y = np.nonzero(counts)
+            centers = (edges[0][:-1] + edges[0][1:]) / 2
+            density = ax.scatter(centers[t], x, y, c=counts[t, x, y], cmap='viridis', marker='s')
+            ax.set_title('X and Y over Time (' + str(len(points['time'])) + ' resets, binned)')
+            fig.colorbar(density).set_label('Resets per bin')
 
         # Customize the plot as needed
         ax.set_xlabel('Time')
         ax.set_ylabel('X')
         ax.set_zlabel('Y')
-        ax.set_title('X and Y over Time (Scatter Plot)')
-        plt.colorbar(sc_nonzero)
 
-        plt.show()
+        if filename is None:
+            import matplotlib.pyplot as plt
+            plt.show()
+            return None
+        fig.savefig(os.path.expanduser(filename))
+        return filename
 
-    def save_xarray_to_hdf5(self, filename):
+    @Instrument.timed('Output.save_xarray_to_hdf5')
+    def save_xarray_to_hdf5(self, filename, folder='~/Downloads'):
         """
-        Save an xarray to an HDF5 file and store it in the "Downloads" folder.
+        Save an xarray to an HDF5 file and store it in a folder ("Downloads" by default).
 
         Args:
             filename (str): Name of the HDF5 file to be created.
+            folder (str): Folder to store the file in.
 
         Returns:
             str: Full path to the saved HDF5 file.
         """
-        # Get the full path to the "Downloads" folder
-        downloads_folder = os.path.expanduser('~/Downloads')
+        # Get the full path to the folder
+        downloads_folder = os.path.expanduser(folder)
 
-        # Combine the downloads folder path with the provided filename
+        # Combine the folder path with the provided filename
         file_path = os.path.join(downloads_folder, filename)
 
-        # Save the xarray to the HDF5 file
-        self.arr.to_netcdf(file_path, engine='h5netcdf')
+        # Save the xarray to the HDF5 file, compressed in chunks of frames (xarray imports h5netcdf on first use)
+        chunks = (min(len(self.arr['time']), 4096),) + self.arr.shape[1:]
+        encoding = {self.arr.name or '__xarray_dataarray_variable__': {'compression': 'gzip', 'chunksizes': chunks}} if len(self.arr['time']) else None
+        self.arr.to_netcdf(file_path, engine='h5netcdf', encoding=encoding)
 
         return file_path
\ No newline at end of file
@@ -69,6 +69,8 @@ class Pixel:
         self.sample_time = sample_time
         self.buffer_time = buffer_time
         self.dead_time = dead_time
+        self.charge_loss = charge_loss
+        self.recombination = recombination
 
     def __str__(self) -> str:
         """
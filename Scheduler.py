@@ -0,0 +1,193 @@
+import heapq
+import numpy as np
+import Instrument
+
+class Scheduler:
+    def __init__(self, tile, arr, start=0) -> None:
+        """
+        Initialize an event-driven Scheduler for a Tile and its time series data.
+
+        Instead of stepping through every timestamp, the Scheduler predicts for every
+        pixel the clock tick at which its charge next reaches the reset threshold and
+        keeps these predictions in a priority queue. Popping the queue executes the
+        earliest reset and predicts the next one for that pixel, so the work grows
+        with the number of reset events rather than with the number of nanoseconds.
+        The charge is only accumulated at clock tick resolution (one sum per clock
+        period), which is all the reset decisions need.
+
+        After a reset a pixel sits out its buffer window (at least one clock period,
+        like the 'active' flag of the Tile) and any charge arriving during its dead
+        time is lost. Both windows are taken from the Tile's pixel parameters, and
+        their ends are kept on the Tile (dead_until, hold_until) so a window running
+        past the end of a block carries on into the next one.
+
+        Args:
+            tile (Tile): The Tile object representing a grid of pixels, its state is updated by run.
+            arr (xarray): The 3D xarray containing data over time and coordinates.
+            start (int): Index of the first time step of arr in the whole recording (when streaming blocks).
+        Raises:
+            Exception: If input array dimensions do not match Tile dimensions.
+        """
+        time_dim, x_dim, y_dim = arr.dims
+        data = tile.convert(arr.values)
+        tile.check_dimension(data.shape[1:])
+
+        self.tile = tile
+        self.start = start
+        self.data = data
+        self.times = np.asarray(arr[time_dim].values, dtype=float)
+
+        # Samples that fall on a clock tick, the only times a reset can happen
+        self.ticks = np.flatnonzero(self.times.astype(int) % tile.clock_freq == 0)
+        self.tick_times = self.times[self.ticks]
+
+        # Charge collected over every clock period (up to and including its tick), summed in time order like Tile.replenish_interval
+        if len(self.ticks):
+            periods = np.add.reduceat(data[:self.ticks[-1] + 1], np.concatenate(([0], self.ticks[:-1] + 1)), axis=0)
+        else:
+            periods = np.zeros((0,) + data.shape[1:], dtype=data.dtype)
+
+        # Cumulative charge of every pixel at every tick, stored time last so each pixel's history is contiguous
+        self.tick_cumulative = np.ascontiguousarray(np.moveaxis(np.cumsum(periods, axis=0), 0, -1))
+        del periods
+
+        # Running maximum of the cumulative charge, sorted so crossings can be found with a binary search
+        self.tick_maximum = np.maximum.accumulate(self.tick_cumulative, axis=-1)
+
+        # Cumulative charge level at which each pixel's capacitors are empty
+        self.base = -tile.charge
+        self.prev_time = tile.prev_time.copy()
+        self.last_fire = np.full((tile.x_dim, tile.y_dim), -1)
+
+        # A pixel that fired cannot fire again within its buffer window or dead time (and never on the next tick)
+        self.dead_time = tile.template.dead_time
+        self.hold = max(tile.clock_freq, tile.template.buffer_time, self.dead_time)
+        self.dead_until = tile.dead_until.copy()
+        self.hold_until = tile.hold_until.copy()
+
+        # Charge arriving before the end of a dead time that started in a previous block is lost too
+        dead = self.times.searchsorted(self.dead_until, side='right')
+        for i, j in zip(*np.nonzero(dead)):
+            self.base[i, j] += data[:dead[i, j], i, j].sum()
+
+        # First tick after the hold window of every pixel
+        held = self.tick_times.searchsorted(self.hold_until, side='right')
+
+        # Priority queue of (tick index, x, y) predicted resets
+        self.queue = []
+        for i in range(0, tile.x_dim):
+            for j in range(0, tile.y_dim):
+                # Inactive pixels (ie the previous clock cycle contained a replenish event) skip the first tick
+                self.schedule(i, j, max(int(held[i, j]), 0 if tile.active[i, j] else 1))
+
+    def schedule(self, i, j, start) -> None:
+        """
+        Predict the next reset of pixel (i, j) at or after a given tick and queue it.
+
+        Parameters:
+            i (int): Row index of the pixel.
+            j (int): Column index of the pixel.
+            start (int): Index of the first tick at which the pixel may reset.
+        """
+        target = self.base[i, j] + self.tile.threshold[i, j]
+        history = self.tick_cumulative[i, j]
+        if start >= len(history):
+            return
+
+        if start == 0 or self.tick_maximum[i, j, start - 1] < target:
+            # The threshold was never reached before 'start', so the first crossing of the running maximum is the answer
+            tick = self.tick_maximum[i, j].searchsorted(target)
+            if tick < len(history):
+                heapq.heappush(self.queue, (int(tick), i, j))
+            return
+
+        # The charge went down since it last passed this level (eg negative noise), scan forward in growing windows
+        window = 64
+        while start < len(history):
+            crossings = np.flatnonzero(history[start:start + window] >= target)
+            if len(crossings):
+                heapq.heappush(self.queue, (int(start + crossings[0]), i, j))
+                return
+            start += window
+            window *= 2
+
+    def run(self, output=None) -> list:
+        """
+        Execute every reset in time order and update the Tile state to the end of the data.
+
+        Parameters:
+            output (Output): Optional Output object to store the instantaneous current frames in.
+
+        Returns:
+            list: Reset events as (time index, x, y, instantaneous current) tuples in time order.
+        """
+        tile = self.tile
+        events = []
+
+        while self.queue:
+            tick, i, j = heapq.heappop(self.queue)
+            index = self.ticks[tick]
+            time = self.tick_times[tick]
+
+            # Execute the replenish and report the current since the last reset
+            events.append((self.start + int(index), i, j, tile.reset_charge[i, j] / (time - self.prev_time[i, j])))
+            self.prev_time[i, j] = time
+            self.last_fire[i, j] = tick
+            self.base[i, j] += tile.threshold[i, j]
+            self.dead_until[i, j] = time + self.dead_time
+            self.hold_until[i, j] = time + self.hold
+
+            # Charge arriving during the dead time is not collected, it is summed from the input when needed
+            if self.dead_time > 0:
+                dead = self.times.searchsorted(time + self.dead_time, side='right') - 1
+                self.base[i, j] += self.data[index + 1:dead + 1, i, j].sum()
+
+            # Predict the next reset after the pixel's hold window
+            self.schedule(i, j, self.tick_times.searchsorted(self.hold_until[i, j], side='right'))
+
+        # Carry the pixel state to the end of the data so the Tile can keep going
+        if len(self.times):
+            # Charge of the last tick plus the samples that arrived after it
+            after = self.ticks[-1] + 1 if len(self.ticks) else 0
+            total = self.tick_cumulative[..., -1] if len(self.ticks) else np.zeros_like(self.base)
+            tile.charge = total + self.data[after:].sum(axis=0) - self.base
+            tile.prev_time = self.prev_time
+            if len(self.ticks):
+                tile.active = self.last_fire != len(self.ticks) - 1
+        tile.dead_until = self.dead_until
+        tile.hold_until = self.hold_until
+
+        if Instrument.ENABLED:
+            Instrument.count('timesteps', len(self.times))
+            resets = np.zeros(tile.charge.shape, dtype=np.int64)
+            for index, i, j, current in events:
+                resets[i, j] += 1
+            Instrument.count_pixels('resets_per_pixel', resets)
+
+        if output is not None:
+            self.write(events, output)
+
+        return events
+
+    def write(self, events, output) -> None:
+        """
+        Store reset events as instantaneous current frames in an Output object.
+
+        Parameters:
+            events (list): Reset events as returned by run.
+            output (Output): The Output object to store simulation results.
+        """
+        clock_freq = self.tile.clock_freq
+
+        # Clear the frames sampled within this block of data (frame indices rounded up)
+        first = -(-self.start // clock_freq)
+        stop = -(-(self.start + len(self.times)) // clock_freq)
+        output.clear(slice(first, stop))
+        if Instrument.ENABLED:
+            Instrument.count('frames_written', max(stop - first, 0))
+
+        # Only the resets on a frame's time step are stored, the same way main.iterate samples the tile status
+        if events:
+            index, x, y, current = (np.array(column) for column in zip(*events))
+            sampled = index % clock_freq == 0
+            output.add_events(index[sampled] // clock_freq, x[sampled], y[sampled], current[sampled])
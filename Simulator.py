@@ -0,0 +1,269 @@
+import numpy as np
+import argparse
+import os
+import Cache
+import Checkpoint
+import Detector
+import Engine
+import Environment
+import Geometry
+import Input
+import Instrument
+import Output
+import Pixel
+import Statistics
+import Tile
+
+class Simulator:
+    def __init__(self, geometry=None, clock_freq=Pixel.CLOCK_FREQ, engine='ticks', envir=None, processes=1, units=None, dtype=None, transport=None, statistics=False, **pixel_params) -> None:
+        """
+        Initialize a reusable Simulator holding the configuration of a detector simulation.
+
+        Every call to run starts from fresh tiles, so the same Simulator can be used on any
+        number of inputs. Nothing is read from or written to disk unless asked for.
+
+        Args:
+            geometry (Geometry): Tile dimensions, number of tiles and pixel-to-column mapping, a single 8x8 tile by default.
+            clock_freq (int): Clock period in nanoseconds.
+            engine (str): One of Engine.ENGINES.
+            envir (callable): Function to apply an environment factor to the data (eg Environment.Noise), None applies nothing.
+            processes (int): Number of worker processes the tiles are split across, None uses one per tile
+                (up to the number of CPUs). Only 1 simulates in this process.
+            units (int): Account charge as exact integer counts of 1/units electron, None keeps float coulombs.
+            dtype (type): Type the input charge is stored as (eg np.float32, or np.int32 with units), see Input.three_d_array.
+            transport (Environment.Transport): Drift of the charge to the pixels (electron life time and transverse diffusion), None applies nothing.
+                It is bound to the pixel parameters, so eg life_time is read from **pixel_params.
+            statistics (bool): Accumulate online statistics of the resets while running (Output.statistics), even when
+                the events are only streamed to a writer.
+            **pixel_params: Keyword arguments forwarded to Tile.Tile (e.g. reset, life_time, w_value).
+        Raises:
+            Exception: If the engine is unknown or does not model a pixel parameter given (see Engine.check_parameters),
+                dtype does not match units, or the transport and the pixel parameters disagree.
+        """
+        if engine not in Engine.ENGINES:
+            raise Exception("Unknown engine '" + str(engine) + "', expected one of " + ", ".join(Engine.ENGINES) + ".")
+        Engine.check_parameters(engine, pixel_params)
+        Input.check_dtype(units, dtype)
+        self.geometry = Geometry.Geometry() if geometry is None else geometry
+        self.clock_freq = clock_freq
+        self.engine = engine
+        self.envir = envir
+        self.processes = processes
+        self.units = units
+        self.dtype = dtype
+        self.transport = None if transport is None else transport.bind(pixel_params)
+        self.statistics = statistics
+        self.pixel_params = pixel_params
+
+        # Tile of the last run of a single tile in this process, holding the pixel state at the end of the data
+        self.tile = None
+
+    def new_tile(self) -> Tile.Tile:
+        """
+        Create a Tile with the configuration of the Simulator.
+
+        Returns:
+            Tile.Tile: A tile with empty capacitors.
+        """
+        return Tile.Tile(self.geometry.x_dim, self.geometry.y_dim, self.clock_freq, self.units, **self.pixel_params)
+
+    def new_statistics(self):
+        """
+        Create the online statistics of a run, if they are asked for.
+
+        Returns:
+            Statistics.Statistics: Empty accumulators for the detector and reset thresholds of the Simulator, None without statistics.
+        """
+        if not self.statistics:
+            return None
+        return Statistics.Statistics(self.geometry, self.new_tile().reset)
+
+    def run(self, arr, writer=None) -> Output.Output:
+        """
+        Simulate the detector over a 2D array of input data.
+
+        Args:
+            arr (np.ndarray): 2D array (time, 1 + pixel columns) with the time stamps in the first column,
+                as returned by Input.file_to_2d.
+            writer (Writer.EventWriter): Writer the reset events are streamed to, they are then not kept in memory.
+
+        Returns:
+            Output: The Output object holding the reset events.
+        """
+        arr = np.asarray(arr)
+        if self.geometry.tiles > 1 or self.processes != 1:
+            # Simulate the tiles of the detector one by one, or split them across a pool of processes sharing the input
+            statistics = self.new_statistics()
+            output = Detector.simulate(arr, self.geometry, self.envir, self.clock_freq, self.engine, self.processes, self.transport,
+                                       statistics if writer is None else None, self.dtype, units=self.units, **self.pixel_params)
+            if writer is None:
+                return output
+            streamed = Output.Output(output.time, self.geometry, writer, keep=False, statistics=statistics)
+            streamed.merge(output)
+            return streamed
+
+        # Arrange the data on the tile and simulate it in one go
+        arr_3d = Input.three_d_array(arr, self.envir, self.geometry, self.units, self.dtype, self.transport)
+        output = Output.Output(np.array(arr_3d['time'])[::self.clock_freq], self.geometry, writer, keep=writer is None, statistics=self.new_statistics())
+        self.tile = self.new_tile()
+        Engine.simulate(self.tile, arr_3d, output, engine=self.engine)
+        return output
+
+    def run_blocks(self, blocks, writer=None) -> Output.Output:
+        """
+        Simulate the detector over consecutive blocks of input data, holding one block in memory at a time.
+
+        Args:
+            blocks (iterable): 2D arrays (time, 1 + pixel columns) of consecutive time stamps, eg from Input.read_blocks.
+            writer (Writer.EventWriter): Writer the reset events are streamed to, they are then not kept in memory.
+
+        Returns:
+            Output: The Output object holding the reset events.
+        Raises:
+            Exception: If the detector has several tiles or more than one process is requested.
+        """
+        if self.geometry.tiles > 1 or self.processes != 1:
+            raise Exception("Block by block simulation only supports a single tile in a single process.")
+        output = Output.Output([], self.geometry, writer, keep=writer is None, statistics=self.new_statistics())
+        self.tile = self.new_tile()
+        arrays = Input.three_d_blocks(blocks, self.envir, self.geometry, self.units, self.dtype, self.transport)
+        Engine.iterate_blocks(self.tile, arrays, output, self.engine)
+        return output
+
+    def run_file(self, path, block_size=None, cache=False, writer=None) -> Output.Output:
+        """
+        Simulate the detector over a CSV file.
+
+        Args:
+            path (str): Path to the CSV file.
+            block_size (int): Number of time stamps read at once, None reads the whole file before simulating.
+            cache (bool): Go through the binary cache of Cache.py instead of parsing the CSV file every time.
+            writer (Writer.EventWriter): Writer the reset events are streamed to, they are then not kept in memory.
+
+        Returns:
+            Output: The Output object holding the reset events.
+        """
+        if block_size is None:
+            return self.run(Cache.load(path) if cache else Input.file_to_2d(path), writer)
+        rows = Cache.read_blocks(path, block_size) if cache else Input.read_blocks(path, block_size)
+        return self.run_blocks(rows, writer)
+
+    def run_chunked(self, source, chunk_size=Input.BLOCK_SIZE, threads=None, writer=None, checkpoint=None,
+                    checkpoint_seconds=Checkpoint.CHECKPOINT_SECONDS, resume=None) -> Output.Output:
+        """
+        Simulate the detector out of core, one chunk of time at a time with the tiles processed by a pool of threads.
+
+        Args:
+            source (str or np.ndarray): Path to a CSV file (memory-mapped through the binary cache), a 2D array
+                (time, 1 + pixel columns), or an xarray chunked along time (eg from Chunked.open_array).
+            chunk_size (int): Number of time stamps per chunk when opening a file or array.
+            threads (int): Number of worker threads, the ThreadPoolExecutor default by default.
+            writer (Writer.EventWriter): Writer the reset events are streamed to chunk by chunk, they are then not kept in memory.
+            checkpoint (str): Path to save a checkpoint to, every checkpoint_seconds and at the end of the recording.
+            checkpoint_seconds (float): Time between two checkpoints.
+            resume (str or dict): Checkpoint to continue from (or to fork from, with other pixel parameters), see Chunked.simulate.
+
+        Returns:
+            Output: The Output object holding the reset events.
+        """
+        # Chunked pulls in dask, which only out-of-core runs need
+        import Chunked
+
+        arr = Chunked.open_array(source, self.geometry, chunk_size) if isinstance(source, (str, np.ndarray)) else source
+        output = Output.Output([], self.geometry, writer, keep=writer is None, statistics=self.new_statistics())
+        tiles = Chunked.simulate(arr, output, self.geometry, self.envir, self.clock_freq, self.engine, threads, self.units, self.dtype,
+                                 checkpoint, checkpoint_seconds, resume, self.transport, **self.pixel_params)
+        self.tile = tiles[0] if len(tiles) == 1 else None
+        return output
+
+def parse_args(argv=None):
+    """
+    Parse the command line of a simulation.
+
+    Args:
+        argv (list): Command line arguments, sys.argv by default.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Simulate a Q-Pix detector over a CSV file without any display.")
+    parser.add_argument('--input', default='Test.csv', help="CSV file containing the data")
+    parser.add_argument('--output', default='output_data.h5', help="HDF5 file to write the frames to")
+    parser.add_argument('--events', action='store_true', help="stream the reset events to --output while simulating instead of saving the frames at the end")
+    parser.add_argument('--clock-freq', type=int, default=Pixel.CLOCK_FREQ, help="clock period in nanoseconds")
+    parser.add_argument('--x-dim', type=int, default=8, help="number of rows of pixels per tile")
+    parser.add_argument('--y-dim', type=int, default=8, help="number of columns of pixels per tile")
+    parser.add_argument('--tiles', type=int, default=1, help="number of tiles of the detector")
+    parser.add_argument('--engine', default='ticks', choices=Engine.ENGINES, help="simulation engine")
+    parser.add_argument('--processes', type=int, default=1, help="number of worker processes the tiles are split across")
+    parser.add_argument('--block-size', type=int, help="number of time stamps read at once (single tile only)")
+    parser.add_argument('--cache', action='store_true', help="memory-map the input through the binary cache")
+    parser.add_argument('--chunked', action='store_true', help="simulate out of core, one --block-size chunk at a time (always through the cache)")
+    parser.add_argument('--threads', type=int, help="number of threads the tiles of a chunk are split across with --chunked")
+    parser.add_argument('--checkpoint', help="file to save the simulation state to while running with --chunked")
+    parser.add_argument('--checkpoint-seconds', type=float, default=Checkpoint.CHECKPOINT_SECONDS, help="time between two checkpoints")
+    parser.add_argument('--resume', action='store_true', help="continue from the --checkpoint file instead of starting over")
+    parser.add_argument('--seed', type=int, help="seed of the noise applied to the input")
+    parser.add_argument('--no-noise', action='store_true', help="simulate the input without noise")
+    parser.add_argument('--units', type=int, help="account charge as integer counts of 1/UNITS electron")
+    parser.add_argument('--drift-length', type=float, help="drift the charge over DRIFT_LENGTH cm with electron life time and transverse diffusion")
+    parser.add_argument('--statistics', help="netCDF file to write the per-pixel statistics and histograms of the resets to")
+    parser.add_argument('--profile', help="JSON file to write a profile of the run to")
+    args = parser.parse_args(argv)
+    if (args.checkpoint or args.resume) and not args.chunked:
+        parser.error("--checkpoint and --resume require --chunked")
+    if args.resume and not args.checkpoint:
+        parser.error("--resume requires --checkpoint")
+    return args
+
+def main(argv=None):
+    """
+    Run a simulation from the command line and save its output.
+
+    Args:
+        argv (list): Command line arguments, sys.argv by default.
+    """
+    args = parse_args(argv)
+    if args.profile:
+        Instrument.enable(profile=True, trace_memory=True)
+
+    geometry = Geometry.Geometry(args.x_dim, args.y_dim, args.tiles)
+    envir = None if args.no_noise else Environment.Noise(seed=args.seed, per_pixel=True)
+    transport = None if args.drift_length is None else Environment.Transport(args.drift_length)
+    simulator = Simulator(geometry, args.clock_freq, args.engine, envir, args.processes, args.units, transport=transport, statistics=bool(args.statistics))
+
+    # A resumed run continues the event file from the position saved in the checkpoint
+    state = Checkpoint.load(args.checkpoint) if args.resume else None
+
+    # The HDF5 writer is only imported when streaming events
+    writer = None
+    if args.events:
+        import Writer
+        writer = Writer.EventWriter(args.output, geometry, position=None if state is None else state['writer'])
+
+    try:
+        if args.chunked:
+            output = simulator.run_chunked(args.input, args.block_size or Input.BLOCK_SIZE, args.threads, writer,
+                                           args.checkpoint, args.checkpoint_seconds, state)
+        else:
+            output = simulator.run_file(args.input, args.block_size, args.cache, writer)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        path = output.save_xarray_to_hdf5(os.path.basename(args.output), os.path.dirname(args.output) or '.')
+        print(f"Xarray saved to: {path}")
+    else:
+        print(f"Reset events saved to: {writer.path}")
+
+    if args.statistics:
+        output.statistics.to_xarray().to_netcdf(args.statistics, engine='h5netcdf')
+        print(f"Statistics saved to: {args.statistics}")
+
+    if args.profile:
+        Instrument.disable()
+        print(f"Profile saved to: {Instrument.write_report(args.profile)}")
+
+if __name__ == '__main__':
+    main()
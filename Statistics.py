@@ -0,0 +1,276 @@
+import numpy as np
+import xarray as xr
+import Geometry
+import Pixel
+
+# Fixed histogram bin edges, 10 per decade: reset intervals in time stamp units (ns) and instantaneous currents
+INTERVAL_BINS = np.logspace(1, 13, 121)
+CURRENT_BINS = np.logspace(-25, -13, 121)
+
+# Number of reset events buffered before they are folded into the accumulators
+PENDING_EVENTS = 65536
+
+# Per-pixel accumulators, in the order they are saved by state
+ARRAYS = ('resets', 'current_mean', 'current_m2', 'current_max', 'interval_mean', 'interval_m2')
+
+def combine(n_a, mean_a, m2_a, n_b, mean_b, m2_b) -> tuple:
+    """
+    Combine the running moments of two sets of values (Chan et al.).
+
+    Args:
+        n_a (np.ndarray): Number of values of the first set.
+        mean_a (np.ndarray): Mean of the first set.
+        m2_a (np.ndarray): Sum of squared deviations from the mean of the first set.
+        n_b (np.ndarray): Number of values of the second set.
+        mean_b (np.ndarray): Mean of the second set.
+        m2_b (np.ndarray): Sum of squared deviations from the mean of the second set.
+
+    Returns:
+        tuple: The mean and the sum of squared deviations of both sets together.
+    """
+    n = n_a + n_b
+    fraction = np.divide(n_b, n, out=np.zeros(np.shape(n)), where=n > 0)
+    delta = mean_b - mean_a
+    return mean_a + delta * fraction, m2_a + m2_b + delta ** 2 * n_a * fraction
+
+def histogram(values, edges) -> np.ndarray:
+    """
+    Count values in fixed bins.
+
+    Args:
+        values (np.ndarray): Values to count.
+        edges (np.ndarray): Increasing bin edges.
+
+    Returns:
+        np.ndarray: len(edges) + 1 counts, the first one below edges[0] and the last one from edges[-1] up.
+    """
+    return np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+
+class Statistics:
+    def __init__(self, geometry=None, reset=6250, interval_bins=INTERVAL_BINS, current_bins=CURRENT_BINS) -> None:
+        """
+        Initialize online accumulators of the resets of a run.
+
+        Every reset updates per-pixel counts and running moments (mean, variance, maximum) of the
+        instantaneous current and of the reset interval, and fixed-bin histograms of both. The
+        memory is O(pixels) however long the run is, the accumulators can be queried at any time
+        during the run (small batches of resets are buffered, call flush before reading the
+        arrays directly), and two Statistics of the same detector (other chunks, tiles or worker
+        processes) can be merged into one.
+
+        Args:
+            geometry (Geometry): Tile dimensions of the detector, a single 8x8 tile by default.
+            reset (int or np.ndarray): Number of electrons for reset, per pixel as an (x, y) or (tile, x, y) array,
+                to recover the reset interval from the instantaneous current.
+            interval_bins (np.ndarray): Bin edges of the reset interval histogram, in time stamp units.
+            current_bins (np.ndarray): Bin edges of the instantaneous current histogram.
+        """
+        self.geometry = Geometry.Geometry() if geometry is None else geometry
+        shape = (self.geometry.tiles, self.geometry.x_dim, self.geometry.y_dim)
+        self.reset_charge = np.broadcast_to(np.asarray(reset) * Pixel.ELECTRON_CHARGE, shape).ravel()
+        self.interval_bins = np.asarray(interval_bins, dtype=float)
+        self.current_bins = np.asarray(current_bins, dtype=float)
+        self.clear()
+
+    def clear(self) -> None:
+        """
+        Drop everything accumulated so far.
+        """
+        # Per-pixel counts and moments, flattened over (tile, x, y)
+        self.resets = np.zeros(self.geometry.pixels, dtype=np.int64)
+        self.current_mean = np.zeros(self.geometry.pixels)
+        self.current_m2 = np.zeros(self.geometry.pixels)
+        self.current_max = np.zeros(self.geometry.pixels)
+        self.interval_mean = np.zeros(self.geometry.pixels)
+        self.interval_m2 = np.zeros(self.geometry.pixels)
+
+        # Histograms of the whole detector, and the last time stamp of the run
+        self.interval_counts = np.zeros(len(self.interval_bins) + 1, dtype=np.int64)
+        self.current_counts = np.zeros(len(self.current_bins) + 1, dtype=np.int64)
+        self.end_time = 0.0
+
+        # Buffered (tile, x, y, current) batches not yet in the accumulators
+        self.pending = []
+        self.pending_events = 0
+
+    def add(self, x, y, current, tile=0) -> None:
+        """
+        Add reset events to the accumulators.
+
+        Args:
+            x (array-like): Row of the pixel of each reset.
+            y (array-like): Column of the pixel of each reset.
+            current (array-like): Instantaneous current of each reset (values that are not positive are ignored).
+            tile (array-like): Tile of the pixel of each reset.
+        """
+        current = np.atleast_1d(np.asarray(current, dtype=float))
+        if not current.size:
+            return
+
+        # Engines record a few resets per frame, they are buffered so the accumulators are updated in large batches
+        columns = tuple(np.full(len(current), values) if np.ndim(values) == 0 else np.array(values) for values in (tile, x, y))
+        self.pending.append(columns + (current.copy(),))
+        self.pending_events += len(current)
+        if self.pending_events >= PENDING_EVENTS:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Fold the buffered reset events into the accumulators.
+        """
+        if not self.pending:
+            return
+        tile, x, y, current = (np.concatenate(column) for column in zip(*self.pending))
+        self.pending = []
+        self.pending_events = 0
+
+        positive = current > 0
+        pixel = np.ravel_multi_index((tile[positive], x[positive], y[positive]), (self.geometry.tiles, self.geometry.x_dim, self.geometry.y_dim))
+        current = current[positive]
+
+        # The current of a reset is its charge over the time since the previous reset of the pixel
+        interval = self.reset_charge[pixel] / current
+
+        # Moments of this batch of events, then combined with the ones accumulated so far
+        n = np.bincount(pixel, minlength=self.geometry.pixels)
+        for name, values in (('current', current), ('interval', interval)):
+            mean = np.divide(np.bincount(pixel, values, self.geometry.pixels), n, out=np.zeros(len(n)), where=n > 0)
+            m2 = np.bincount(pixel, (values - mean[pixel]) ** 2, self.geometry.pixels)
+            self.update_moments(name, n, mean, m2)
+        self.resets += n
+        np.maximum.at(self.current_max, pixel, current)
+
+        self.interval_counts += histogram(interval, self.interval_bins)
+        self.current_counts += histogram(current, self.current_bins)
+
+    def update_moments(self, name, n, mean, m2) -> None:
+        """
+        Combine per-pixel moments of new values into the accumulated ones (before the reset counts are updated).
+
+        Args:
+            name (str): 'current' or 'interval'.
+            n (np.ndarray): Number of new values of every pixel.
+            mean (np.ndarray): Mean of the new values of every pixel.
+            m2 (np.ndarray): Sum of squared deviations of the new values of every pixel.
+        """
+        mean, m2 = combine(self.resets, getattr(self, name + '_mean'), getattr(self, name + '_m2'), n, mean, m2)
+        setattr(self, name + '_mean', mean)
+        setattr(self, name + '_m2', m2)
+
+    def extend(self, time) -> None:
+        """
+        Follow the time stamps of the run, for the input rate.
+
+        Args:
+            time (array-like): New time stamps of the run.
+        """
+        if len(time):
+            self.end_time = max(self.end_time, float(np.max(time)))
+
+    def merge(self, other) -> None:
+        """
+        Add the accumulators of another Statistics of the same detector, eg of another chunk, tile or worker process.
+
+        Args:
+            other (Statistics): Statistics to add into this one.
+        Raises:
+            Exception: If the detectors or the histogram bins differ.
+        """
+        if other.resets.shape != self.resets.shape or not (np.array_equal(other.interval_bins, self.interval_bins) and np.array_equal(other.current_bins, self.current_bins)):
+            raise Exception("Statistics of different detectors or histogram bins cannot be merged.")
+        self.flush()
+        other.flush()
+        for name in ('current', 'interval'):
+            self.update_moments(name, other.resets, getattr(other, name + '_mean'), getattr(other, name + '_m2'))
+        self.resets += other.resets
+        np.maximum(self.current_max, other.current_max, out=self.current_max)
+        self.interval_counts += other.interval_counts
+        self.current_counts += other.current_counts
+        self.end_time = max(self.end_time, other.end_time)
+
+    def state(self) -> dict:
+        """
+        Get a copy of the accumulators, eg to checkpoint a long run.
+
+        Returns:
+            dict: One array per accumulator.
+        """
+        self.flush()
+        state = {name: getattr(self, name).copy() for name in ARRAYS + ('interval_counts', 'current_counts')}
+        state['end_time'] = np.array(self.end_time)
+        return state
+
+    def set_state(self, state) -> None:
+        """
+        Restore the accumulators from a copy made by state.
+
+        Args:
+            state (dict): One array per accumulator.
+        """
+        for name in ARRAYS + ('interval_counts', 'current_counts'):
+            setattr(self, name, np.array(state[name]))
+        self.end_time = float(state['end_time'])
+
+        # Events buffered before the restore are already counted in the state
+        self.pending = []
+        self.pending_events = 0
+
+    def summary(self) -> dict:
+        """
+        Summarize the whole detector so far.
+
+        Returns:
+            dict: The statistics of Sweep.STATISTICS, plus the standard deviation of the current, the mean
+                and standard deviation of the reset interval and the input rate (charge per time stamp unit)
+                inferred from the resets.
+        """
+        self.flush()
+        total = int(self.resets.sum())
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Moments of the whole detector from the moments of its pixels
+            current_mean = (self.resets * self.current_mean).sum() / total if total else 0.0
+            current_m2 = self.current_m2.sum() + (self.resets * (self.current_mean - current_mean) ** 2).sum()
+            interval_mean = (self.resets * self.interval_mean).sum() / total if total else 0.0
+            interval_m2 = self.interval_m2.sum() + (self.resets * (self.interval_mean - interval_mean) ** 2).sum()
+        return {
+            'resets': total,
+            'active_pixels': int((self.resets > 0).sum()),
+            'mean_resets_per_pixel': float(self.resets.mean()),
+            'max_resets_per_pixel': int(self.resets.max()),
+            'mean_current': float(current_mean),
+            'max_current': float(self.current_max.max()),
+            'std_current': float(np.sqrt(current_m2 / total)) if total else 0.0,
+            'mean_interval': float(interval_mean),
+            'std_interval': float(np.sqrt(interval_m2 / total)) if total else 0.0,
+            'input_rate': float((self.resets * self.reset_charge).sum() / self.end_time) if self.end_time else 0.0,
+        }
+
+    def to_xarray(self) -> xr.Dataset:
+        """
+        Get the per-pixel statistics and the histograms so far as an xarray Dataset.
+
+        Returns:
+            xr.Dataset: 'resets', 'mean_current', 'std_current', 'max_current', 'mean_interval', 'std_interval'
+                and 'input_rate' over (tile, x, y), and the 'interval_histogram' and 'current_histogram' counts
+                indexed by the lower edge of their bins (0 for the underflow bin).
+        """
+        self.flush()
+        shape = (self.geometry.tiles, self.geometry.x_dim, self.geometry.y_dim)
+        n = np.maximum(self.resets, 1)
+        pixel_stats = {
+            'resets': self.resets,
+            'mean_current': self.current_mean,
+            'std_current': np.sqrt(self.current_m2 / n),
+            'max_current': self.current_max,
+            'mean_interval': self.interval_mean,
+            'std_interval': np.sqrt(self.interval_m2 / n),
+            'input_rate': self.resets * self.reset_charge / self.end_time if self.end_time else np.zeros(len(n)),
+        }
+        data_vars = {name: (('tile', 'x', 'y'), values.reshape(shape)) for name, values in pixel_stats.items()}
+        data_vars['interval_histogram'] = ('interval', self.interval_counts.copy())
+        data_vars['current_histogram'] = ('current', self.current_counts.copy())
+        coords = {
+            'tile': np.arange(self.geometry.tiles), 'x': np.arange(self.geometry.x_dim), 'y': np.arange(self.geometry.y_dim),
+            'interval': np.concatenate(([0.0], self.interval_bins)), 'current': np.concatenate(([0.0], self.current_bins)),
+        }
+        return xr.Dataset(data_vars, coords=coords)
@@ -0,0 +1,201 @@
+import numpy as np
+import xarray as xr
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import Cache
+import Detector
+import Engine
+import Environment
+import Geometry
+import Input
+import Output
+import Pixel
+
+# Parameters every engine reads, the ones only the event-driven engine models, and the ones of the drift of the charge
+ENGINE_PARAMETERS = ('clock_freq', 'reset', 'charge', 'prev_time', 'active')
+EVENT_PARAMETERS = Engine.EVENT_PARAMETERS
+TRANSPORT_PARAMETERS = ('drift_length',) + Environment.Transport.PARAMETERS
+
+# Summary statistics computed for every configuration of a sweep
+STATISTICS = ('resets', 'active_pixels', 'mean_resets_per_pixel', 'max_resets_per_pixel', 'mean_current', 'max_current')
+
+def summarize(output) -> dict:
+    """
+    Compute summary statistics of a simulation from its online statistics, or else from its reset event log.
+
+    Args:
+        output (Output): The Output object holding the results of the simulation.
+
+    Returns:
+        dict: The value of every statistic in STATISTICS.
+    """
+    if output.statistics is not None:
+        summary = output.statistics.summary()
+        return {stat: summary[stat] for stat in STATISTICS}
+
+    events = output.events()
+    geometry = output.geometry
+    currents = events['current'][events['current'] > 0]
+
+    # Number of resets of every pixel of the detector
+    pixels = np.ravel_multi_index((events['tile'], events['x'], events['y']), (geometry.tiles, geometry.x_dim, geometry.y_dim))
+    per_pixel = np.bincount(pixels[events['current'] > 0], minlength=geometry.pixels)
+    return {
+        'resets': int(per_pixel.sum()),
+        'active_pixels': int((per_pixel > 0).sum()),
+        'mean_resets_per_pixel': float(per_pixel.mean()),
+        'max_resets_per_pixel': int(per_pixel.max()),
+        'mean_current': float(currents.mean()) if currents.size else 0.0,
+        'max_current': float(currents.max()) if currents.size else 0.0,
+    }
+
+def check_parameters(names, engine='ticks', drift_length=None) -> None:
+    """
+    Make sure every swept parameter changes the simulation, so a sweep never returns a flat grid by mistake.
+
+    Args:
+        names (list): Names of the swept parameters.
+        engine (str): One of Engine.ENGINES.
+        drift_length (float): Drift distance of the charge in cm, None if the charge does not drift (unless swept).
+
+    Raises:
+        Exception: If a parameter is not read by the engine, or is a drift parameter without any drift length.
+    """
+    for name in names:
+        if name in EVENT_PARAMETERS and engine != 'events':
+            raise Exception("Sweeping '" + name + "' has no effect with the '" + engine + "' engine, only the 'events' engine models it.")
+        if name in TRANSPORT_PARAMETERS and drift_length is None and 'drift_length' not in names:
+            raise Exception("Sweeping '" + name + "' has no effect without a drift of the charge, give a drift_length.")
+        if name not in ENGINE_PARAMETERS + EVENT_PARAMETERS + TRANSPORT_PARAMETERS:
+            raise Exception("Sweeping '" + name + "' has no effect, no engine reads it.")
+
+def run_configuration(name, shape, geometry, config, engine, drift_length=None, noise=None) -> dict:
+    """
+    Simulate every tile of the detector for one configuration and summarize it (runs in a worker process).
+
+    Args:
+        name (str): Name of the shared memory block holding the detector data.
+        shape (tuple): Shape of the detector data.
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping of the detector.
+        config (dict): Pixel parameters of the configuration, plus 'clock_freq' for the clock period and
+            'drift_length' for the drift distance.
+        engine (str): One of Engine.ENGINES.
+        drift_length (float): Drift distance of the charge in cm when it is not swept, None for no drift.
+        noise (str): Name of the shared memory block holding the noise added after the drift, see Detector.share_noise.
+
+    Returns:
+        dict: The summary statistics of the configuration, the reset events themselves are dropped.
+    """
+    pixel_params = dict(config)
+    clock_freq = pixel_params.pop('clock_freq', Pixel.CLOCK_FREQ)
+    drift_length = pixel_params.pop('drift_length', drift_length)
+
+    # The drift takes the liquid argon parameters of this configuration
+    transport = None if drift_length is None else Environment.Transport(drift_length).bind(pixel_params)
+
+    output = Output.Output([], geometry)
+    for k, tile_output in Detector.simulate_tiles(name, shape, geometry, range(geometry.tiles), clock_freq, engine, pixel_params, transport, noise):
+        output.merge(tile_output, k)
+    return summarize(output)
+
+def sweep(arr, parameters, geometry=None, envir=None, engine='ticks', processes=None, drift_length=None) -> xr.Dataset:
+    """
+    Simulate every combination of a grid of parameters in parallel.
+
+    The input (with the environment factor applied) is placed once in shared memory for all the
+    configurations, and only the summary statistics of each configuration are kept. With a drift
+    of the charge, the drift is applied to the shared input in every configuration and the noise,
+    drawn once, is added after it.
+
+    Args:
+        arr (np.ndarray): 2D NumPy array (time, 1 + pixel columns) as returned by Input.file_to_2d.
+        parameters (dict): Values to sweep for each parameter, eg {'reset': [5000, 6250], 'clock_freq': [10, 20]}.
+            The parameters the engines read can be swept ('clock_freq', 'reset' and, with the 'events' engine,
+            'dead_time' and 'buffer_time'), as well as 'drift_length' and the Pixel parameters of the drift
+            ('life_time', 'e_val', 'diffusion_t', 'pix_size', see Environment.Transport).
+        geometry (Geometry): Tile dimensions and pixel-to-column mapping, a single 8x8 tile by default.
+        envir (callable): Function to apply an environment factor to the data, see Input.apply_environment.
+        engine (str): One of Engine.ENGINES.
+        processes (int): Number of worker processes, the number of CPUs by default.
+        drift_length (float): Drift distance of the charge in cm for every configuration, None for no drift (unless swept).
+
+    Returns:
+        xr.Dataset: One variable per statistic in STATISTICS, with one dimension per swept parameter.
+    Raises:
+        Exception: If a swept parameter would not change the results, see check_parameters.
+    """
+    geometry = Geometry.Geometry() if geometry is None else geometry
+    names = list(parameters)
+    check_parameters(names, engine, drift_length)
+    values = [list(parameters[name]) for name in names]
+    configs = [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+    # Without a drift the noise is applied once to the shared input, otherwise it is shared on its own and added after the drift
+    drifts = drift_length is not None or 'drift_length' in names
+    memory = Detector.share(arr, None if drifts else envir)
+    noise = Detector.share_noise(arr.shape, envir) if drifts and envir is not None else None
+    try:
+        with ProcessPoolExecutor(processes) as pool:
+            summaries = list(pool.map(run_configuration, itertools.repeat(memory.name), itertools.repeat(arr.shape),
+                                      itertools.repeat(geometry), configs, itertools.repeat(engine), itertools.repeat(drift_length),
+                                      itertools.repeat(None if noise is None else noise.name)))
+    finally:
+        for block in (memory, noise):
+            if block is not None:
+                block.close()
+                block.unlink()
+
+    # Lay the summaries out on the grid of parameters
+    shape = tuple(len(v) for v in values)
+    data_vars = {stat: (names, np.array([summary[stat] for summary in summaries]).reshape(shape)) for stat in STATISTICS}
+    return xr.Dataset(data_vars, coords=dict(zip(names, values)))
+
+def parse_args(argv=None):
+    """
+    Parse the command line of a parameter sweep.
+
+    Args:
+        argv (list): Command line arguments, sys.argv by default.
+
+    Returns:
+        argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(description="Simulate every combination of pixel and clock parameters in parallel.")
+    parser.add_argument('--input', default='Test.csv', help="CSV file containing the data")
+    parser.add_argument('--output', default='sweep.h5', help="HDF5 file to write the summary statistics to")
+    parser.add_argument('--reset', type=int, nargs='+', help="reset thresholds in electrons")
+    parser.add_argument('--clock-freq', type=int, nargs='+', help="clock periods in nanoseconds")
+    parser.add_argument('--drift-length', type=float, nargs='+', help="drift distances of the charge in cm")
+    parser.add_argument('--life-time', type=float, nargs='+', help="electron life times in seconds (needs --drift-length)")
+    parser.add_argument('--diffusion-t', type=float, nargs='+', help="transverse diffusions in cm^2/s (needs --drift-length)")
+    parser.add_argument('--dead-time', type=int, nargs='+', help="dead times in nanoseconds (--engine events)")
+    parser.add_argument('--buffer-time', type=int, nargs='+', help="buffer windows in nanoseconds (--engine events)")
+    parser.add_argument('--engine', default='ticks', choices=Engine.ENGINES, help="simulation engine")
+    parser.add_argument('--processes', type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--seed', type=int, help="seed of the noise applied to the input")
+    parser.add_argument('--no-noise', action='store_true', help="simulate the input without noise")
+    parser.add_argument('--cache', action='store_true', help="memory-map the input through the binary cache")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """
+    Run a parameter sweep from the command line and save the summary statistics.
+
+    Args:
+        argv (list): Command line arguments, sys.argv by default.
+    """
+    args = parse_args(argv)
+    names = ('reset', 'clock_freq', 'drift_length', 'life_time', 'diffusion_t', 'dead_time', 'buffer_time')
+    parameters = {name: getattr(args, name) for name in names if getattr(args, name) is not None}
+
+    arr = Cache.load(args.input) if args.cache else Input.file_to_2d(args.input)
+    envir = None if args.no_noise else Environment.Noise(seed=args.seed, per_pixel=True)
+
+    dataset = sweep(arr, parameters, envir=envir, engine=args.engine, processes=args.processes)
+    dataset.to_netcdf(args.output, engine='h5netcdf')
+    print(dataset)
+    print(f"Sweep saved to: {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import numpy as np
+
+# Mean charge in coulombs collected by a pixel per nanosecond without signal (the level of Test.csv)
+BACKGROUND_CHARGE = 1.6e-17
+
+# Probability of a signal hit on a pixel per nanosecond
+SIGNAL_RATE = 1e-4
+
+# Mean charge in coulombs of a signal hit
+SIGNAL_CHARGE = 1e-15
+
+def generate_blocks(time_steps, pixels, background=BACKGROUND_CHARGE, signal_rate=SIGNAL_RATE, signal_charge=SIGNAL_CHARGE, seed=None, block_size=100000):
+    """
+    Generate synthetic Q-Pix input data in the layout of Input.file_to_2d, block by block.
+
+    Every pixel collects a uniformly distributed background charge each nanosecond, plus signal
+    hits arriving at random with an exponentially distributed charge.
+
+    Args:
+        time_steps (int): Number of time stamps (one per nanosecond, starting at 0).
+        pixels (int): Number of pixel columns.
+        background (float): Mean background charge per pixel per nanosecond in coulombs.
+        signal_rate (float): Probability of a signal hit per pixel per nanosecond.
+        signal_charge (float): Mean charge of a signal hit in coulombs.
+        seed (int): Seed of the generator, None draws a fresh one.
+        block_size (int): Maximum number of time stamps per block.
+
+    Yields:
+        np.ndarray: 2D arrays (time, 1 + pixels) with the time stamps in the first column.
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, time_steps, block_size):
+        n = min(block_size, time_steps - start)
+        block = np.empty((n, 1 + pixels))
+        block[:, 0] = np.arange(start, start + n)
+        block[:, 1:] = rng.uniform(0, 2 * background, (n, pixels))
+
+        # Signal hits on top of the background
+        hits = rng.random((n, pixels)) < signal_rate
+        block[:, 1:][hits] += rng.exponential(signal_charge, int(hits.sum()))
+        yield block
+
+def generate(time_steps, pixels, **kwargs) -> np.ndarray:
+    """
+    Generate synthetic Q-Pix input data in the layout of Input.file_to_2d.
+
+    Args:
+        time_steps (int): Number of time stamps (one per nanosecond, starting at 0).
+        pixels (int): Number of pixel columns.
+        **kwargs: Keyword arguments forwarded to generate_blocks (background, signal_rate, signal_charge, seed).
+
+    Returns:
+        np.ndarray: A 2D array (time, 1 + pixels) with the time stamps in the first column.
+    """
+    blocks = list(generate_blocks(time_steps, pixels, **kwargs))
+    return np.concatenate(blocks) if blocks else np.empty((0, 1 + pixels))
+
+def write_csv(path, time_steps, pixels, **kwargs) -> str:
+    """
+    Write synthetic Q-Pix input data to a CSV file in the layout of Test.csv, block by block.
+
+    Args:
+        path (str): Path to the CSV file to create.
+        time_steps (int): Number of time stamps (one per nanosecond, starting at 0).
+        pixels (int): Number of pixel columns.
+        **kwargs: Keyword arguments forwarded to generate_blocks (background, signal_rate, signal_charge, seed, block_size).
+
+    Returns:
+        str: Path to the CSV file.
+    """
+    header = ",".join(["Timestamp (ns)"] + ["Pixel " + str(i + 1) for i in range(pixels)])
+    with open(path, 'w') as csvfile:
+        csvfile.write(header + "\n")
+        for block in generate_blocks(time_steps, pixels, **kwargs):
+            np.savetxt(csvfile, block, delimiter=',', fmt=['%d'] + ['%.2E'] * pixels)
+    return path
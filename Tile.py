@@ -1,23 +1,132 @@
 import numpy as np
+import Input
+import Instrument
 import Pixel
 
 class Tile:
-    def __init__(self, x_dim=8, y_dim=8) -> None:
+    def __init__(self, x_dim=8, y_dim=8, clock_freq=Pixel.CLOCK_FREQ, units=None, **pixel_params) -> None:
         """
-        Initialize a Tile object with a 2D array of Pixels.
+        Initialize a Tile object holding the state of a 2D grid of Pixels.
+
+        The pixel state is stored as a struct of arrays (one NumPy array per
+        attribute, indexed by (x, y)) so that a single call to replenish
+        advances every pixel at once.
 
         Args:
             x_dim (int): Number of rows in the Tile grid.
             y_dim (int): Number of columns in the Tile grid.
+            clock_freq (int): Clock period in nanoseconds.
+            units (int): Account charge as exact integer counts of 1/units electron (1 counts whole electrons)
+                in int64 arrays, None keeps it as float coulombs.
+            **pixel_params: Keyword arguments forwarded to Pixel.Pixel (e.g. reset, life_time, w_value).
+                'reset' may also be given as an (x_dim, y_dim) array for per-pixel thresholds.
         """
-        self.arr = np.empty((x_dim, y_dim), dtype=object)
         self.x_dim = x_dim
         self.y_dim = y_dim
+        self.clock_freq = clock_freq
+        self.units = units
 
-        # Create Pixel objects and populate the array with them
-        for i in range(0, self.x_dim):
-            for j in range(0, self.y_dim):
-                self.arr[i][j] = Pixel.Pixel(id=(i, j))
+        # Per-pixel reset thresholds may be an array, the remaining parameters are shared by the whole tile
+        reset = pixel_params.pop('reset', None)
+        self.template = Pixel.Pixel(id=None, **pixel_params)
+        if reset is None:
+            reset = self.template.reset
+
+        # Pixel state, one contiguous array per attribute
+        shape = (self.x_dim, self.y_dim)
+        self.charge = self.convert(np.full(shape, float(self.template.charge)))
+        self.prev_time = np.full(shape, float(self.template.prev_time))
+        self.active = np.full(shape, bool(self.template.active))
+
+        # Times up to which the charge of a pixel is lost (dead time) and it cannot reset (buffer window), see Scheduler
+        self.dead_until = np.full(shape, -np.inf)
+        self.hold_until = np.full(shape, -np.inf)
+        self.reset = np.broadcast_to(np.asarray(reset), shape).copy()
+
+        # Charge (in coulombs) removed by a reset, and the same threshold in the units of the capacitor state
+        self.reset_charge = self.reset * Pixel.ELECTRON_CHARGE
+        self.threshold = self.reset_charge if units is None else np.rint(self.reset * units).astype(np.int64)
+
+    def convert(self, arr) -> np.ndarray:
+        """
+        Convert charge values to the units of the capacitor state.
+
+        Args:
+            arr (array-like): Charge values in coulombs, or already quantized integer counts.
+        Returns:
+            np.ndarray: Float coulombs, or int64 counts of 1/units electron when accounting in integers.
+        """
+        if self.units is None:
+            return np.asarray(arr, dtype=float)
+        arr = np.asarray(arr)
+        if np.issubdtype(arr.dtype, np.integer):
+            return arr.astype(np.int64, copy=False)
+        return Input.quantize(arr, self.units)
+
+    def coulombs(self, charge) -> np.ndarray:
+        """
+        Convert charge values from the units of the capacitor state to coulombs.
+
+        Args:
+            charge (array-like): Charge values as stored in the capacitors.
+        Returns:
+            np.ndarray: The charge values in coulombs.
+        """
+        if self.units is None:
+            return np.asarray(charge, dtype=float)
+        return np.asarray(charge) * (Pixel.ELECTRON_CHARGE / self.units)
+
+    def pixel(self, i, j) -> Pixel.Pixel:
+        """
+        Build a Pixel object mirroring the current state of pixel (i, j).
+
+        Args:
+            i (int): Row index of the pixel.
+            j (int): Column index of the pixel.
+
+        Returns:
+            Pixel.Pixel: A standalone copy of the pixel's parameters and state.
+        """
+        params = dict(vars(self.template))
+        params.update(id=(i, j), charge=float(self.coulombs(self.charge[i, j])), prev_time=float(self.prev_time[i, j]),
+                      active=bool(self.active[i, j]), reset=self.reset[i, j].item())
+        return Pixel.Pixel(**params)
+
+    def state(self) -> dict:
+        """
+        Get a copy of the state of every Pixel, eg to checkpoint a long run.
+
+        Returns:
+            dict: The 'charge', 'prev_time', 'active', 'dead_until' and 'hold_until' arrays, and the 'units'
+                of the charge (0 for float coulombs).
+        """
+        return {'charge': self.charge.copy(), 'prev_time': self.prev_time.copy(), 'active': self.active.copy(),
+                'dead_until': self.dead_until.copy(), 'hold_until': self.hold_until.copy(), 'units': np.array(self.units or 0)}
+
+    def set_state(self, state) -> None:
+        """
+        Restore the state of every Pixel from a copy made by state, converting the charge to the units of this Tile.
+
+        Args:
+            state (dict): The 'charge', 'prev_time', 'active', 'dead_until' and 'hold_until' arrays, and the 'units'
+                of the charge (the windows are closed when a state has none).
+        Raises:
+            Exception: If the arrays do not match Tile dimensions, or integer charge counts come without their units.
+        """
+        self.check_dimension(np.shape(state['charge']))
+        charge = np.asarray(state['charge'])
+        if 'units' in state:
+            # Counts saved in other units go through coulombs, float coulombs are quantized by convert
+            units = int(state['units']) or None
+            if units is not None and units != self.units:
+                charge = charge * (Pixel.ELECTRON_CHARGE / units)
+        elif np.issubdtype(charge.dtype, np.integer) and self.units is None:
+            raise Exception("Charge counts of unknown units cannot be restored into a Tile accounting in coulombs.")
+        self.charge = self.convert(charge).copy()
+        self.prev_time = np.array(state['prev_time'], dtype=float)
+        self.active = np.array(state['active'], dtype=bool)
+        for name in ('dead_until', 'hold_until'):
+            setattr(self, name, np.array(state[name], dtype=float) if name in state else np.full(self.active.shape, -np.inf))
 
     def __str__(self) -> str:
         """
@@ -26,30 +135,106 @@ class Tile:
         Returns:
             str: A formatted string representation of the Tile object.
         """
+        result = ""
         for i in range(0, self.x_dim):
             for j in range(0, self.y_dim):
-                print("ID: (" + str(i) + ", " + str(j) + "):\n")
-                print(self.arr[i][j])
+                result += "ID: (" + str(i) + ", " + str(j) + "):\n"
+                result += str(self.pixel(i, j))
+        return result
+
+    def check_dimension(self, shape) -> None:
+        """
+        Check that a frame of time series data matches the Tile dimensions.
+
+        Args:
+            shape (tuple): Shape of the (x, y) frame.
+        Raises:
+            Exception: If input array dimensions do not match Tile dimensions.
+        """
+        if len(shape) != 2 or tuple(shape) != (self.x_dim, self.y_dim):
+            raise Exception("Tile and time series data must have the same dimension. Tile has dimension (" + str(self.x_dim) + "," + str(self.y_dim) + ") and data has dimension (" + ",".join(str(n) for n in shape) + ").")
 
     def replenish(self, arr, t) -> np.ndarray:
         """
-        Replenish the charge in each Pixel based on input array and time.
+        Replenish the charge in every Pixel at once based on input array and time.
+
+        This is the vectorized equivalent of calling Pixel.replenish on each pixel:
+        on a clock tick every active pixel whose charge reaches its threshold resets
+        and reports its instantaneous current, otherwise the charge is accumulated.
 
         Args:
-            arr (np.ndarray): 2D array containing charge values to replenish with.
+            arr (np.ndarray): 2D array containing charge values to replenish with (see convert).
             t (float): Current time.
         Returns:
-            np.ndarray: A 2D array containing the replenished charge values.
+            np.ndarray: A 2D array containing the instantaneous current of each pixel.
+        Raises:
+            Exception: If input array dimensions do not match Tile dimensions.
+        """
+        arr = self.convert(arr)
+        self.check_dimension(arr.shape)
+        if Instrument.ENABLED:
+            Instrument.count('replenish_calls')
+            Instrument.count('timesteps')
+
+        # Add the new charge to the capacitors
+        return self.step(arr + self.charge, float(t))
+
+    def replenish_interval(self, arr, t) -> np.ndarray:
+        """
+        Replenish the charge in every Pixel with all the samples since the previous call.
+
+        Equivalent to calling replenish once per row of arr, where only the last row
+        (at time t) may fall on a clock tick. The samples are summed onto the stored
+        charge in time order in a single reduction, so the result is bit-for-bit the
+        same as the per-nanosecond path.
+
+        Args:
+            arr (np.ndarray): 3D array (time, x, y) of charge values, the last row at time t.
+            t (float): Time of the last row.
+        Returns:
+            np.ndarray: A 2D array containing the instantaneous current of each pixel at time t.
         Raises:
             Exception: If input array dimensions do not match Tile dimensions.
         """
-        if self.x_dim != len(arr) or self.y_dim != len(arr[0]):
-            raise Exception("Tile and time series data must have the same dimension. Tile has dimension (" + str(self.x_dim) + "," + str(self.y_dim) + ") and data has dimension (" + str(len(arr)) + "," + str(len(arr[0])) + ").")
-        
+        arr = self.convert(arr)
+        self.check_dimension(arr.shape[1:])
+        if Instrument.ENABLED:
+            Instrument.count('replenish_calls')
+            Instrument.count('timesteps', len(arr))
+
+        # Seed the reduction with the stored charge so the additions happen in the same order as one row at a time
+        total = np.add.reduce(np.concatenate((self.charge[np.newaxis], arr)), axis=0)
+        return self.step(total, float(t))
+
+    def step(self, total, time) -> np.ndarray:
+        """
+        Execute the replenish decision for every Pixel given the charge on the capacitors.
+
+        Args:
+            total (np.ndarray): 2D array of charge on the capacitors including the new charge, in the units of the capacitor state.
+            time (float): Current time.
+        Returns:
+            np.ndarray: A 2D array containing the instantaneous current of each pixel.
+        """
         output = np.zeros((self.x_dim, self.y_dim))
-        for i in range(0, self.x_dim):
-            for j in range(0, self.y_dim):
-                # Call the replenish method of each Pixel with the corresponding charge and time.
-                output[i][j] = self.arr[i][j].replenish(charge=arr[i][j], time=float(t))
-        
+
+        if int(time) % self.clock_freq != 0:
+            # Not at a clock tick, just keep the new charge
+            self.charge = total
+            return output
+
+        # At a tick, active pixels (ie the previous clock cycle did not contain a replenish event) above threshold reset
+        fire = self.active & (total >= self.threshold)
+
+        # Remove the reset charge from the capacitors and report the current since the last reset
+        total[fire] -= self.threshold[fire]
+        output[fire] = self.reset_charge[fire] / (time - self.prev_time[fire])
+        self.prev_time[fire] = time
+
+        # Pixels that fired sit out the next tick, all others become active again
+        self.charge = total
+        self.active = ~fire
+        if Instrument.ENABLED:
+            Instrument.count_pixels('resets_per_pixel', fire)
+
         return output
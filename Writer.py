@@ -0,0 +1,153 @@
+import numpy as np
+import os
+import time as clock
+import h5py
+import Geometry
+import Output
+
+# Number of rows per HDF5 chunk of every column
+CHUNK_ROWS = 65536
+
+# Events buffered in memory before they are written to the file
+FLUSH_ROWS = 65536
+
+# Longest time in seconds buffered events wait before they are written to the file
+FLUSH_SECONDS = 10.0
+
+class EventWriter:
+    def __init__(self, path, geometry=None, chunk_rows=CHUNK_ROWS, compression='gzip', flush_rows=FLUSH_ROWS, flush_seconds=FLUSH_SECONDS, position=None) -> None:
+        """
+        Initialize a writer appending reset events to a chunked, compressed HDF5 file during the simulation.
+
+        The file holds one resizable dataset per column of Output.EVENT_COLUMNS plus the 'time' stamps
+        of the frames, and the detector geometry as attributes. It is written in single-writer/
+        multiple-reader mode, so open_output can read it while the simulation is still running; a
+        crash only loses the events not flushed yet.
+
+        Args:
+            path (str): Path to the HDF5 file to create (overwritten if it exists).
+            geometry (Geometry): Tile dimensions of the detector, a single 8x8 tile by default.
+            chunk_rows (int): Number of rows per HDF5 chunk.
+            compression (str): HDF5 compression filter, None for no compression.
+            flush_rows (int): Number of buffered events that triggers a write to the file.
+            flush_seconds (float): Time after which buffered events are written to the file.
+            position (dict): Resume an existing file at a position returned by position (eg from a checkpoint),
+                dropping whatever was written after it. None creates a new file.
+        """
+        self.geometry = Geometry.Geometry() if geometry is None else geometry
+        self.path = os.path.expanduser(path)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+
+        columns = dict(Output.EVENT_COLUMNS, time=float)
+        if position is None:
+            self.file = h5py.File(self.path, 'w', libver='latest')
+            self.file.attrs['x_dim'] = self.geometry.x_dim
+            self.file.attrs['y_dim'] = self.geometry.y_dim
+            self.file.attrs['tiles'] = self.geometry.tiles
+
+            # Every dataset has to exist before switching to single-writer/multiple-reader mode
+            for name, dtype in columns.items():
+                self.file.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype, chunks=(chunk_rows,), compression=compression)
+        else:
+            # Cut every dataset back to the resume position
+            self.file = h5py.File(self.path, 'r+', libver='latest')
+            for name in columns:
+                self.file[name].resize((position[name],))
+        self.file.swmr_mode = True
+
+        # Data waiting to be written, one list of arrays per dataset
+        self.buffers = {name: [] for name in columns}
+        self.buffered = 0
+        self.last_flush = clock.monotonic()
+
+    def append(self, frame, x, y, current, tile=0) -> None:
+        """
+        Buffer reset events, writing them to the file once enough events or time have accumulated.
+
+        Parameters:
+            frame (array-like): Frame index of each reset.
+            x (array-like): Row of the pixel of each reset.
+            y (array-like): Column of the pixel of each reset.
+            current (array-like): Instantaneous current of each reset.
+            tile (array-like): Tile of the pixel of each reset.
+        """
+        current = np.atleast_1d(current)
+        n = len(current)
+        for name, values in zip(('frame', 'tile', 'x', 'y', 'current'), (frame, tile, x, y, current)):
+            self.buffers[name].append(np.broadcast_to(values, (n,)))
+        self.buffered += n
+        self.maybe_flush()
+
+    def extend_time(self, time) -> None:
+        """
+        Buffer the time stamps of new frames.
+
+        Parameters:
+            time (array-like): Array containing the new time stamps.
+        """
+        self.buffers['time'].append(np.asarray(time, dtype=float))
+        self.maybe_flush()
+
+    def maybe_flush(self) -> None:
+        """
+        Write the buffered data to the file if the row or time flush interval has been reached.
+        """
+        if self.buffered >= self.flush_rows or clock.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Append the buffered data to the datasets and make it visible to readers.
+        """
+        for name, buffer in self.buffers.items():
+            if not buffer:
+                continue
+            values = np.concatenate(buffer)
+            buffer.clear()
+            if not len(values):
+                continue
+            dataset = self.file[name]
+            dataset.resize((len(dataset) + len(values),))
+            dataset[-len(values):] = values
+            dataset.flush()
+        self.file.flush()
+        self.buffered = 0
+        self.last_flush = clock.monotonic()
+
+    def position(self) -> dict:
+        """
+        Write the buffered data and get the length of every dataset, eg to checkpoint a long run.
+
+        Returns:
+            dict: The number of rows of every dataset.
+        """
+        self.flush()
+        return {name: len(self.file[name]) for name in self.buffers}
+
+    def close(self) -> None:
+        """
+        Write the remaining buffered data and close the file.
+        """
+        if self.file:
+            self.flush()
+            self.file.close()
+
+def open_output(path) -> Output.Output:
+    """
+    Read an event file written by EventWriter, possibly while the simulation is still writing it.
+
+    Args:
+        path (str): Path to the HDF5 file.
+
+    Returns:
+        Output: An Output object holding every event flushed to the file so far.
+    """
+    with h5py.File(os.path.expanduser(path), 'r', libver='latest', swmr=True) as file:
+        geometry = Geometry.Geometry(int(file.attrs['x_dim']), int(file.attrs['y_dim']), int(file.attrs['tiles']))
+        output = Output.Output(file['time'][:], geometry)
+
+        # Columns are flushed one after the other, only read the events every column already holds
+        n = min(len(file[name]) for name in Output.EVENT_COLUMNS)
+        output.add_events(file['frame'][:n], file['x'][:n], file['y'][:n], file['current'][:n], file['tile'][:n])
+    return output
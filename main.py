@@ -1,8 +1,9 @@
-import Input
-import Tile
-import numpy as np
+import os
 import Environment
-import Output
+import Geometry
+import Instrument
+import Simulator
+from Engine import iterate, iterate_ticks, iterate_blocks
 
 # Path to the CSV file containing data
 file = 'Test.csv'
@@ -10,53 +11,79 @@ file = 'Test.csv'
 # Clock period in nanoseconds
 CLOCK_FREQ = 20
 
-# Convert CSV file to a 2D NumPy array
-arr = Input.file_to_2d(file)
+# Simulation engine, one of Engine.ENGINES ('step', 'ticks' or 'events')
+ENGINE = 'ticks'
 
-# Convert 2D array to a 3D xarray with Gaussian noise
-arr_3d = Input.three_d_array(arr, Environment.make_gaussian_noise)
+# Tile dimensions, number of tiles and pixel-to-column mapping of the detector
+GEOMETRY = Geometry.Geometry(x_dim=8, y_dim=8, tiles=1)
 
-# Extract the 'time' dimension from the 3D array and convert it into an numpy array
-temp = np.array(arr_3d['time'])
+# Number of worker processes the tiles are split across (None uses one per tile, up to the number of CPUs)
+PROCESSES = 1
 
-# Initialize an Output object to store the results
-output = Output.Output(temp[::CLOCK_FREQ])
+# Seed of the noise applied to the input, None draws a fresh one
+SEED = None
 
-def iterate(tile, arr, output):
-    """
-    Iterate over time and update the 'tile' object and 'output' (executing replenishes)
+# Keep a binary copy of the parsed CSV file in Cache.CACHE_DIR and memory-map it on later runs
+CACHE = False
 
-    Parameters:
-        tile (Tile): The Tile object representing a grid of pixels.
-        arr (xarray): The 3D xarray containing data over time and coordinates.
-        output (Output): The Output object to store simulation results.
-    """
-    # Get the dimensions of the 3D xarray
-    time_dim, x_dim, y_dim = arr.dims
+# Number of time stamps read from the CSV file at once, None reads the whole file before simulating
+BLOCK_SIZE = None
 
-    # Loop over each time step
-    for t in range(len(arr[time_dim])):
-        # Replenish the 'tile' with data for the current time step and coordinates
-        status = tile.replenish(arr[t], arr[time_dim][t])
+# Account charge as exact integer counts of 1/UNITS electron (1 counts whole electrons), None keeps float coulombs
+UNITS = None
 
-        # Store the status for every 'CLOCK_FREQ' time step in 'output' (ie only store data at every clock tick - and therefore replenish)
-        if t % CLOCK_FREQ == 0:
-            output.set_frame(t=int(t/CLOCK_FREQ), arr=status)
+# Type the input charge is stored as (eg np.float32, or np.int32 with UNITS, to halve its memory), None for float64 (int64 with UNITS)
+DTYPE = None
 
-# Create a Tile object representing a grid of pixels
-tile = Tile.Tile()
+# Folder the HDF5 output is saved to
+OUTPUT_FOLDER = '~/Downloads'
 
-# Call the 'iterate' function to simulate and update the 'tile' and 'output'
-iterate(tile, arr_3d, output)
+# Stream the reset events to this chunked, compressed HDF5 file while simulating (None keeps them in memory and saves them at the end)
+EVENTS_FILE = None
 
-# # Plot the coordinates over time using 'output' with a threshold value
-# output.plot_coordinates_over_time(1.2e-17)
+# Collect stage timers and counters (plus a cProfile and tracemalloc capture) and write a report to PROFILE_FILE
+PROFILE = False
 
-# # Plot a time lapse of the tile
-# output.time_lapse()
+# Report of the run, saved as JSON in OUTPUT_FOLDER with a human-readable summary next to it (same name, .txt extension)
+PROFILE_FILE = 'profile.json'
 
-# # Plot a time lapse of the tile but as a histogram
-# output.time_lapse_histogram()
+if __name__ == '__main__':
+    if PROFILE:
+        Instrument.enable(profile=True, trace_memory=True)
 
-output_file_path = output.save_xarray_to_hdf5('output_data.h5')
-print(f"Xarray saved to: {output_file_path}")
\ No newline at end of file
+    # Seeded Gaussian and leakage noise, generated per pixel so it does not depend on the block size
+    noise = Environment.Noise(seed=SEED, per_pixel=True)
+
+    # Simulator holding the configuration of the detector, reusable on any number of inputs
+    simulator = Simulator.Simulator(GEOMETRY, CLOCK_FREQ, ENGINE, noise, PROCESSES, UNITS, DTYPE)
+
+    # Writer the reset events are appended to as the simulation runs (the HDF5 modules are only imported when needed)
+    writer = None
+    if EVENTS_FILE is not None:
+        import Writer
+        writer = Writer.EventWriter(os.path.join(os.path.expanduser(OUTPUT_FOLDER), EVENTS_FILE), GEOMETRY)
+
+    # Simulate the CSV file, whole or block by block, and update 'output'
+    output = simulator.run_file(file, BLOCK_SIZE, CACHE, writer)
+
+    # # Plot the coordinates over time using 'output' with a threshold value
+    # output.plot_coordinates_over_time(1.2e-17)
+
+    # # Plot a time lapse of the tile
+    # output.time_lapse()
+
+    # # Plot a time lapse of the tile but as a histogram
+    # output.time_lapse_histogram()
+
+    if writer is None:
+        output_file_path = output.save_xarray_to_hdf5('output_data.h5', OUTPUT_FOLDER)
+        print(f"Xarray saved to: {output_file_path}")
+    else:
+        writer.close()
+        print(f"Reset events saved to: {writer.path}")
+
+    if PROFILE:
+        Instrument.disable()
+        report_path = Instrument.write_report(os.path.join(os.path.expanduser(OUTPUT_FOLDER), PROFILE_FILE))
+        print(Instrument.summary())
+        print(f"Profile saved to: {report_path}")